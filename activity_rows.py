@@ -0,0 +1,53 @@
+"""Column-only reads of activities for list endpoints and pages.
+
+Selecting Activity entities adds every row to the session's identity map and
+then converts it again through ActivityResponse. The read paths select just
+the ActivityResponse columns instead and keep each row as an ActivityRow
+dict, which templates read like an entity and ORJSONResponse encodes without
+Pydantic.
+"""
+from sqlalchemy import Select, select
+
+from models import Activity
+from schemas import ActivityResponse
+
+# Columns of ActivityResponse, in the order of its fields (and of its JSON)
+ACTIVITY_ROW_COLUMNS = tuple(getattr(Activity, name) for name in ActivityResponse.model_fields)
+
+
+class ActivityRow(dict):
+    """An activity's columns by name, also readable as attributes.
+
+    Jinja tries attribute access before item access, so on a plain dict
+    every ``activity.start_time`` in a template raises and catches an
+    AttributeError first.
+    """
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+def activity_row_columns(model=Activity) -> tuple:
+    """The ActivityResponse columns of model, Activity or ArchivedActivity (same columns)."""
+    if model is Activity:
+        return ACTIVITY_ROW_COLUMNS
+    return tuple(getattr(model, name) for name in ActivityResponse.model_fields)
+
+
+def select_activity_rows(model=Activity) -> Select:
+    """A select of the ActivityResponse columns; add filters and ordering as usual.
+
+    Pass ArchivedActivity as model to read the archive.
+    """
+    return select(*activity_row_columns(model))
+
+
+def activity_dicts(result) -> list[ActivityRow]:
+    """Turn the rows of a select_activity_rows() result into ActivityRow dicts."""
+    # Row._asdict() looks the keys up again for every row
+    keys = tuple(result.keys())
+    return [ActivityRow(zip(keys, row)) for row in result]
@@ -0,0 +1,70 @@
+"""Alembic environment for the database configured by DATABASE_URL.
+
+init_db() runs the migrations on the application's own connection (passed
+in config.attributes); the ``alembic`` command line opens one from the
+application's async engine.
+"""
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+
+from config import settings
+from database import Base
+import models  # noqa: F401  (registers the tables on Base.metadata)
+
+config = context.config
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    """Print the SQL of the migrations instead of running them (``--sql``)."""
+    context.configure(
+        url=settings.database_url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Leave database objects the models don't describe to the revisions.
+
+    The notes search index (an FTS5 table or expression index, created with
+    raw SQL) would otherwise show up as a removal in ``alembic check``.
+    """
+    return not (reflected and compare_to is None)
+
+
+def do_run_migrations(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        # SQLite cannot alter columns in place; batch mode rebuilds the table
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations():
+    from database import engine
+
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+        await connection.commit()
+    await engine.dispose()
+
+
+connection = config.attributes.get("connection")
+if context.is_offline_mode():
+    run_migrations_offline()
+elif connection is not None:
+    do_run_migrations(connection)
+else:
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    asyncio.run(run_async_migrations())
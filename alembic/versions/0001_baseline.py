@@ -0,0 +1,93 @@
+"""Baseline schema
+
+The schema as of the last pre-Alembic migration (migrations.LEGACY_MIGRATIONS).
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "baby_profiles",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("birthday", sa.Date(), nullable=False),
+        sa.Column("photo_path", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_baby_profiles_id", "baby_profiles", ["id"])
+
+    op.create_table(
+        "activities",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("activity_type", sa.String(), nullable=False),
+        sa.Column("start_time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("end_time", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("auto_closed", sa.Boolean(), server_default="0", nullable=False),
+        sa.Column("duration_seconds", sa.Integer(), nullable=True),
+        sa.Column("local_day", sa.Date(), nullable=True),
+        sa.Column("notes", sa.Text(), nullable=True),
+        sa.Column("role", sa.String(), nullable=True),
+        sa.Column("profile_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("idempotency_key", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(["profile_id"], ["baby_profiles.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_activities_id", "activities", ["id"])
+    op.create_index("ix_activities_profile_start", "activities", ["profile_id", "start_time"])
+    op.create_index(
+        "ix_activities_profile_type_start", "activities", ["profile_id", "activity_type", "start_time"]
+    )
+    op.create_index("ix_activities_start_time", "activities", ["start_time"])
+    op.create_index("ix_activities_idempotency_key", "activities", ["idempotency_key"], unique=True)
+
+    op.create_table(
+        "activity_changes",
+        sa.Column("seq", sa.Integer(), nullable=False),
+        sa.Column("activity_id", sa.Integer(), nullable=False),
+        sa.Column("profile_id", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("seq"),
+        sqlite_autoincrement=True,
+    )
+    op.create_index("ix_activity_changes_profile_seq", "activity_changes", ["profile_id", "seq"])
+
+    op.create_table(
+        "daily_activity_stats",
+        sa.Column("profile_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("activity_type", sa.String(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("completed_count", sa.Integer(), nullable=False),
+        sa.Column("total_duration_seconds", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("profile_id", "day", "activity_type"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("daily_activity_stats")
+    op.drop_index("ix_activity_changes_profile_seq", table_name="activity_changes")
+    op.drop_table("activity_changes")
+    op.drop_index("ix_activities_idempotency_key", table_name="activities")
+    op.drop_index("ix_activities_start_time", table_name="activities")
+    op.drop_index("ix_activities_profile_type_start", table_name="activities")
+    op.drop_index("ix_activities_profile_start", table_name="activities")
+    op.drop_index("ix_activities_id", table_name="activities")
+    op.drop_table("activities")
+    op.drop_index("ix_baby_profiles_id", table_name="baby_profiles")
+    op.drop_table("baby_profiles")
@@ -0,0 +1,64 @@
+"""Full-text search index over activity notes
+
+SQLite gets an external-content FTS5 table kept in sync with activities by
+triggers; PostgreSQL a GIN index on the notes' tsvector. See search.py.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 18:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name == "postgresql":
+        op.execute(
+            "CREATE INDEX ix_activities_notes_search ON activities "
+            "USING gin (to_tsvector('simple', coalesce(notes, '')))"
+        )
+        return
+
+    # The FTS table stores only the index; notes are read from activities.
+    # The prefix indexes make 2 and 3 character prefix queries index lookups.
+    op.execute(
+        "CREATE VIRTUAL TABLE activity_notes_fts USING fts5("
+        "notes, content='activities', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    op.execute(
+        "CREATE TRIGGER activities_notes_fts_insert AFTER INSERT ON activities BEGIN "
+        "INSERT INTO activity_notes_fts (rowid, notes) VALUES (new.id, new.notes); END"
+    )
+    op.execute(
+        "CREATE TRIGGER activities_notes_fts_delete AFTER DELETE ON activities BEGIN "
+        "INSERT INTO activity_notes_fts (activity_notes_fts, rowid, notes) "
+        "VALUES ('delete', old.id, old.notes); END"
+    )
+    op.execute(
+        "CREATE TRIGGER activities_notes_fts_update AFTER UPDATE OF notes ON activities BEGIN "
+        "INSERT INTO activity_notes_fts (activity_notes_fts, rowid, notes) "
+        "VALUES ('delete', old.id, old.notes); "
+        "INSERT INTO activity_notes_fts (rowid, notes) VALUES (new.id, new.notes); END"
+    )
+    op.execute("INSERT INTO activity_notes_fts (activity_notes_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name == "postgresql":
+        op.execute("DROP INDEX ix_activities_notes_search")
+        return
+
+    op.execute("DROP TRIGGER activities_notes_fts_update")
+    op.execute("DROP TRIGGER activities_notes_fts_delete")
+    op.execute("DROP TRIGGER activities_notes_fts_insert")
+    op.execute("DROP TABLE activity_notes_fts")
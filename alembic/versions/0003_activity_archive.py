@@ -0,0 +1,98 @@
+"""Archive of old activities with monthly summaries
+
+activities_archive holds completed activities moved out of activities by
+archive.py and archive_months a per-month summary of them. Archived notes
+get a search index of their own, like those in activities (revision 0002).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 21:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "activities_archive",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("activity_type", sa.String(), nullable=False),
+        sa.Column("start_time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("end_time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("auto_closed", sa.Boolean(), nullable=False),
+        sa.Column("duration_seconds", sa.Integer(), nullable=True),
+        sa.Column("local_day", sa.Date(), nullable=True),
+        sa.Column("notes", sa.Text(), nullable=True),
+        sa.Column("role", sa.String(), nullable=True),
+        sa.Column("profile_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["profile_id"], ["baby_profiles.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_activities_archive_profile_start", "activities_archive", ["profile_id", "start_time"])
+
+    op.create_table(
+        "archive_months",
+        sa.Column("profile_id", sa.Integer(), nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("activity_type", sa.String(), nullable=False),
+        sa.Column("role", sa.String(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("total_duration_seconds", sa.Integer(), nullable=False),
+        sa.Column("first_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_end", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("profile_id", "month", "activity_type", "role"),
+    )
+
+    if op.get_context().dialect.name == "postgresql":
+        op.execute(
+            "CREATE INDEX ix_activities_archive_notes_search ON activities_archive "
+            "USING gin (to_tsvector('simple', coalesce(notes, '')))"
+        )
+        return
+
+    op.execute(
+        "CREATE VIRTUAL TABLE archived_notes_fts USING fts5("
+        "notes, content='activities_archive', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    op.execute(
+        "CREATE TRIGGER activities_archive_notes_fts_insert AFTER INSERT ON activities_archive BEGIN "
+        "INSERT INTO archived_notes_fts (rowid, notes) VALUES (new.id, new.notes); END"
+    )
+    op.execute(
+        "CREATE TRIGGER activities_archive_notes_fts_delete AFTER DELETE ON activities_archive BEGIN "
+        "INSERT INTO archived_notes_fts (archived_notes_fts, rowid, notes) "
+        "VALUES ('delete', old.id, old.notes); END"
+    )
+    op.execute(
+        "CREATE TRIGGER activities_archive_notes_fts_update AFTER UPDATE OF notes ON activities_archive BEGIN "
+        "INSERT INTO archived_notes_fts (archived_notes_fts, rowid, notes) "
+        "VALUES ('delete', old.id, old.notes); "
+        "INSERT INTO archived_notes_fts (rowid, notes) VALUES (new.id, new.notes); END"
+    )
+
+
+def downgrade() -> None:
+    # Run `python archive.py restore` first: archived activities are dropped
+    if op.get_context().dialect.name == "postgresql":
+        op.execute("DROP INDEX ix_activities_archive_notes_search")
+    else:
+        op.execute("DROP TRIGGER activities_archive_notes_fts_update")
+        op.execute("DROP TRIGGER activities_archive_notes_fts_delete")
+        op.execute("DROP TRIGGER activities_archive_notes_fts_insert")
+        op.execute("DROP TABLE archived_notes_fts")
+    op.drop_table("archive_months")
+    op.drop_index("ix_activities_archive_profile_start", table_name="activities_archive")
+    op.drop_table("activities_archive")
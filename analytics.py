@@ -0,0 +1,65 @@
+from collections import Counter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+from typing import Optional
+
+from archive import get_archive_bounds, tiered_queries
+from models import Activity, ArchiveMonth
+from schemas import AnalyticsSummary
+from rollups import get_type_totals
+
+
+async def get_analytics_summary(db: AsyncSession, profile_id: Optional[int]) -> AnalyticsSummary:
+    """Compute the analytics summary of a profile with grouped SQL aggregates.
+
+    Only a handful of aggregate rows are loaded, so the cost no longer grows
+    with the number of activities held in memory. Archived activities are
+    counted from the archive's monthly summaries.
+    """
+    summary = AnalyticsSummary()
+
+    # Counts and completed durations per activity type from the daily rollups
+    summary.by_type = await get_type_totals(db, profile_id)
+    summary.total = sum(stats.count for stats in summary.by_type.values())
+
+    if not summary.total:
+        return summary
+
+    # Tracking period, including what the archive's monthly summaries hold
+    range_result = await db.execute(
+        select(func.min(Activity.start_time), func.max(Activity.start_time))
+        .where(Activity.for_profile(profile_id))
+    )
+    summary.first_start, summary.latest_start = range_result.one()
+    archive = await get_archive_bounds(db, profile_id)
+    if archive is not None:
+        summary.first_start = min(filter(None, (summary.first_start, archive.first_start)))
+        summary.latest_start = max(filter(None, (summary.latest_start, archive.last_start)))
+
+    # Latest activity
+    def latest_rows(model):
+        return select(model.activity_type, model.start_time, model.id).where(model.for_profile(profile_id))
+
+    for query in await tiered_queries(db, profile_id, latest_rows):
+        latest = (await db.execute(query.limit(1))).first()
+        if latest is not None:
+            summary.latest_type = latest.activity_type
+            break
+
+    # Activities per caregiver role
+    role_result = await db.execute(
+        select(Activity.role, func.count(Activity.id))
+        .where(Activity.for_profile(profile_id), Activity.role.is_not(None), Activity.role != "")
+        .group_by(Activity.role)
+    )
+    role_counts = Counter(dict(role_result.all()))
+    if archive is not None:
+        archived_roles = await db.execute(
+            select(ArchiveMonth.role, func.sum(ArchiveMonth.count))
+            .where(ArchiveMonth.profile_id == (profile_id or 0), ArchiveMonth.role != "")
+            .group_by(ArchiveMonth.role)
+        )
+        role_counts.update(dict(archived_roles.all()))
+    summary.role_counts = dict(role_counts.most_common())
+
+    return summary
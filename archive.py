@@ -0,0 +1,260 @@
+"""Hot/cold tiering of activity history.
+
+Completed activities of the local months that ended ARCHIVE_AFTER_DAYS or
+more days ago are moved from activities to activities_archive, which has
+the same columns and keeps their ids:
+
+    python archive.py run              # months older than ARCHIVE_AFTER_DAYS
+    python archive.py run --days 90
+    python archive.py restore          # move everything back
+
+archive_months keeps a summary of the archive per profile, local month,
+type and role: counts, total duration, first and last start and the last
+end. Archived activities stay in the daily rollups and in the sync change
+log, so archiving changes nothing a page or client can see; it only keeps
+the activities table, its indexes and the search index small.
+
+Reads go through tiered_queries(). Activities that started after the
+profile's last archived start can only be in the hot table and are read
+from it alone; only when more rows are needed, older ones are read from a
+UNION ALL of the hot table (entries logged late for an archived month) and
+the archive, merged in start_time order. Both are range reads of a
+(profile_id, start_time) index.
+
+An archived activity is completed, so a write can only end it, or be ended
+by it, if the write starts before the activity's end. The auto-close rules
+(autoclose.load_neighbours) therefore move the archived activities next to
+a write back into activities when the write starts at or before the
+profile's last archived end, and editing or deleting an archived activity
+moves it back first.
+
+Batches are committed one by one, so the archive can be run while the
+server is up; a page read at the moment a batch commits may miss or repeat
+an activity of that batch.
+"""
+import argparse
+import asyncio
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import Select, delete, func, insert, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from activity_rows import ActivityRow, activity_dicts
+from config import settings
+from models import Activity, ArchivedActivity, ArchiveMonth, LOCAL_TIMEZONE, local_day
+
+# Activities moved per transaction
+ARCHIVE_BATCH_SIZE = 2000
+
+# Columns moved between activities and activities_archive
+ARCHIVE_COLUMNS = tuple(column.name for column in ArchivedActivity.__table__.columns)
+
+ArchiveBounds = namedtuple("ArchiveBounds", "first_start last_start last_end")
+
+
+async def get_archive_bounds(db: AsyncSession, profile_id: Optional[int]) -> Optional[ArchiveBounds]:
+    """First and last start and last end of a profile's archived activities, None if there are none."""
+    result = await db.execute(
+        select(func.min(ArchiveMonth.first_start), func.max(ArchiveMonth.last_start), func.max(ArchiveMonth.last_end))
+        .where(ArchiveMonth.profile_id == (profile_id or 0))
+    )
+    bounds = ArchiveBounds(*result.one())
+    return bounds if bounds.last_start is not None else None
+
+
+def _ordered(query, descending: bool):
+    columns = query.selected_columns
+    if descending:
+        return query.order_by(columns.start_time.desc(), columns.id.desc())
+    return query.order_by(columns.start_time, columns.id)
+
+
+async def tiered_queries(
+    db: AsyncSession,
+    profile_id: Optional[int],
+    build: Callable[[type], Select],
+    descending: bool = True
+) -> list:
+    """Queries that read a profile's activities from both tables in (start_time, id) order.
+
+    build(model) returns the select to run against Activity or
+    ArchivedActivity, with the profile filter and any others; its columns
+    must include start_time and id. Run the queries in turn, adding limits
+    or yield_per as needed, and stop once enough rows were read: the
+    archive is only queried by the last one.
+    """
+    bounds = await get_archive_bounds(db, profile_id)
+    if bounds is None:
+        return [_ordered(build(Activity), descending)]
+
+    recent = build(Activity).where(Activity.start_time > bounds.last_start)
+    older = union_all(
+        build(Activity).where(Activity.start_time <= bounds.last_start),
+        build(ArchivedActivity),
+    )
+    queries = [_ordered(recent, descending), _ordered(older, descending)]
+    return queries if descending else queries[::-1]
+
+
+async def read_activity_rows(db: AsyncSession, queries: list, limit: int) -> list[ActivityRow]:
+    """Up to limit rows of tiered select_activity_rows() queries, as ActivityRow dicts."""
+    rows = []
+    for query in queries:
+        rows.extend(activity_dicts(await db.execute(query.limit(limit - len(rows)))))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+async def get_archived_activity(db: AsyncSession, activity_id: int) -> Optional[ArchivedActivity]:
+    result = await db.execute(select(ArchivedActivity).where(ArchivedActivity.id == activity_id))
+    return result.scalar_one_or_none()
+
+
+def archive_cutoff(today: date, days: int) -> datetime:
+    """Start of the local month containing today - days; earlier months are archived."""
+    month = (today - timedelta(days=days)).replace(day=1)
+    return _local_midnight(month)
+
+
+def _local_midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=LOCAL_TIMEZONE).astimezone(timezone.utc)
+
+
+def _months(rows: Iterable[dict]) -> set:
+    return {(row["profile_id"], local_day(row["start_time"]).replace(day=1)) for row in rows}
+
+
+async def refresh_months(db: AsyncSession, months: Iterable[tuple]):
+    """Recompute the archive_months rows of (profile_id, first day of month) pairs."""
+    role = func.coalesce(ArchivedActivity.role, "")
+    for profile_id, month in months:
+        next_month = (month + timedelta(days=31)).replace(day=1)
+        await db.execute(
+            delete(ArchiveMonth).where(ArchiveMonth.profile_id == (profile_id or 0), ArchiveMonth.month == month)
+        )
+        result = await db.execute(
+            select(
+                ArchivedActivity.activity_type,
+                role,
+                func.count(),
+                func.coalesce(func.sum(ArchivedActivity.duration_seconds), 0),
+                func.min(ArchivedActivity.start_time),
+                func.max(ArchivedActivity.start_time),
+                func.max(ArchivedActivity.end_time),
+            )
+            .where(
+                ArchivedActivity.for_profile(profile_id),
+                ArchivedActivity.start_time >= _local_midnight(month),
+                ArchivedActivity.start_time < _local_midnight(next_month),
+            )
+            .group_by(ArchivedActivity.activity_type, role)
+        )
+        rows = [
+            {
+                "profile_id": profile_id or 0,
+                "month": month,
+                "activity_type": activity_type,
+                "role": activity_role,
+                "count": count,
+                "total_duration_seconds": total_duration_seconds,
+                "first_start": first_start,
+                "last_start": last_start,
+                "last_end": last_end,
+            }
+            for activity_type, activity_role, count, total_duration_seconds, first_start, last_start, last_end
+            in result.all()
+        ]
+        if rows:
+            await db.execute(insert(ArchiveMonth), rows)
+
+
+async def _move(db: AsyncSession, source, target, *conditions) -> list[dict]:
+    """Delete the rows of source matching conditions and insert them into target."""
+    result = await db.execute(
+        delete(source).where(*conditions).returning(*(source.c[name] for name in ARCHIVE_COLUMNS))
+    )
+    rows = [row._asdict() for row in result]
+    if rows:
+        await db.execute(insert(target), rows)
+    return rows
+
+
+async def archive_activities(db: AsyncSession, before: datetime, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Archive the completed activities that started before a moment; returns how many.
+
+    Commits after every batch of batch_size activities.
+    """
+    hot = Activity.__table__
+    eligible = (hot.c.start_time < before, hot.c.end_time.is_not(None))
+    archived = 0
+    while True:
+        result = await db.execute(
+            select(hot.c.id).where(*eligible).order_by(hot.c.start_time, hot.c.id).limit(batch_size)
+        )
+        ids = result.scalars().all()
+        if not ids:
+            break
+        # Conditions checked again: a row may have changed since it was selected
+        rows = await _move(db, hot, ArchivedActivity.__table__, hot.c.id.in_(ids), *eligible)
+        await refresh_months(db, _months(rows))
+        await db.commit()
+        archived += len(rows)
+    return archived
+
+
+async def restore_activities(db: AsyncSession, *conditions) -> int:
+    """Move the archived activities matching conditions back into activities, in the current transaction."""
+    rows = await _move(db, ArchivedActivity.__table__, Activity.__table__, *conditions)
+    if rows:
+        await refresh_months(db, _months(rows))
+    return len(rows)
+
+
+async def restore_all(db: AsyncSession, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Move every archived activity back, committing after every batch; returns how many."""
+    restored = 0
+    while True:
+        batch = select(ArchivedActivity.id).order_by(ArchivedActivity.id).limit(batch_size)
+        count = await restore_activities(db, ArchivedActivity.id.in_(batch.scalar_subquery()))
+        await db.commit()
+        if not count:
+            return restored
+        restored += count
+
+
+async def delete_profile_archive(db: AsyncSession, profile_id: int):
+    """Remove the archived activities of a deleted profile."""
+    await db.execute(delete(ArchivedActivity).where(ArchivedActivity.profile_id == profile_id))
+    await db.execute(delete(ArchiveMonth).where(ArchiveMonth.profile_id == profile_id))
+
+
+async def _main(command: str, days: int):
+    from database import async_session, engine, init_db
+
+    await init_db()
+    async with async_session() as db:
+        if command == "run":
+            before = archive_cutoff(datetime.now(LOCAL_TIMEZONE).date(), days)
+            count = await archive_activities(db, before)
+            print(f"Archived {count} activities that started before {before.astimezone(LOCAL_TIMEZONE).date()}")
+        else:
+            count = await restore_all(db)
+            print(f"Restored {count} archived activities")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old activities to the archive and back")
+    parser.add_argument(
+        "command", choices=["run", "restore"],
+        help="run: archive the completed activities of old months; restore: move all of them back"
+    )
+    parser.add_argument(
+        "--days", type=int, default=settings.archive_after_days,
+        help="archive months that ended at least this many days ago (default: ARCHIVE_AFTER_DAYS)"
+    )
+    args = parser.parse_args()
+    asyncio.run(_main(args.command, args.days))
@@ -0,0 +1,250 @@
+"""Automatic ending of open activities.
+
+An activity logged without an end_time stays open until a later activity of
+the same profile ends it. Which later activities may do so is the close rule
+of the open activity's type:
+
+* ``any``: the next activity of any type (the default)
+* ``same_type``: the next activity of the same type
+* ``never``: the activity stays open until it is edited
+
+Rules are configured with AUTO_CLOSE_DEFAULT and AUTO_CLOSE_RULES (for example
+``AUTO_CLOSE_RULES=diaper=never,feeding=same_type``).
+
+Ends set this way are flagged ``auto_closed``. When an activity is inserted
+before such an end (a backdated entry), moved by an edit or deleted, the
+ends around its old and new position are recomputed. Only the activities
+next to those positions are read, each with one seek on the (profile_id,
+start_time) or (profile_id, activity_type, start_time) index, so the cost
+does not grow with the amount of history.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from archive import get_archive_bounds, restore_activities
+from config import settings
+from models import Activity, ArchivedActivity
+from rollups import snapshot
+
+CLOSE_ANY = "any"
+CLOSE_SAME_TYPE = "same_type"
+CLOSE_NEVER = "never"
+CLOSE_RULES = (CLOSE_ANY, CLOSE_SAME_TYPE, CLOSE_NEVER)
+
+for _rule in (settings.auto_close_default, *settings.auto_close_rules.values()):
+    if _rule not in CLOSE_RULES:
+        raise ValueError(f"Unknown auto-close rule {_rule!r}, expected one of {', '.join(CLOSE_RULES)}")
+
+# Fields the close rules read and write
+CLOSE_FIELDS = ("id", "profile_id", "activity_type", "start_time", "end_time", "auto_closed")
+
+
+def close_rule(activity_type: str) -> str:
+    return settings.auto_close_rules.get(activity_type, settings.auto_close_default)
+
+
+def closes(closer_type: str, open_type: str) -> bool:
+    """Whether an activity of closer_type ends an earlier open activity of open_type."""
+    rule = close_rule(open_type)
+    return rule == CLOSE_ANY or (rule == CLOSE_SAME_TYPE and closer_type == open_type)
+
+
+def _needs_end(row: dict, start_time: datetime) -> bool:
+    """An activity is ended by a closer starting at start_time if it is open or auto-closed later."""
+    return row["end_time"] is None or (row["auto_closed"] and row["end_time"] > start_time)
+
+
+def apply_close_rules(existing_rows: list[dict], new_rows: list[dict]) -> list[tuple[dict, Optional[datetime]]]:
+    """Apply the close rules to one profile's rows in start_time order.
+
+    Rows are dicts with the CLOSE_FIELDS keys. Existing rows are already
+    consistent with each other, so only pairs involving a new row are
+    considered. All rows are updated in place; returns the existing rows
+    whose end changed together with their previous end_time. Activities
+    starting at the same time do not end each other.
+    """
+    new_ids = {id(row) for row in new_rows}
+    previous_ends = {}
+    timeline = sorted(existing_rows + new_rows, key=lambda row: row["start_time"])
+
+    # Rows at the latest earlier start time, overall and per type
+    previous_group = []
+    previous_by_type = {}
+    group_start = None
+    group = []
+    for row in timeline:
+        if row["start_time"] != group_start:
+            if group:
+                previous_group = group
+                group_by_type = defaultdict(list)
+                for earlier in group:
+                    group_by_type[earlier["activity_type"]].append(earlier)
+                previous_by_type.update(group_by_type)
+            group = []
+            group_start = row["start_time"]
+        group.append(row)
+
+        candidates = [
+            previous for previous in previous_group if close_rule(previous["activity_type"]) == CLOSE_ANY
+        ]
+        if close_rule(row["activity_type"]) == CLOSE_SAME_TYPE:
+            candidates.extend(previous_by_type.get(row["activity_type"], ()))
+
+        for previous in candidates:
+            if id(row) not in new_ids and id(previous) not in new_ids:
+                continue
+            if not _needs_end(previous, row["start_time"]):
+                continue
+            if id(previous) not in new_ids:
+                previous_ends.setdefault(id(previous), (previous, previous["end_time"]))
+            previous["end_time"] = row["start_time"]
+            previous["auto_closed"] = True
+
+    return list(previous_ends.values())
+
+
+async def load_neighbours(
+    db: AsyncSession,
+    profile_id: Optional[int],
+    first_start: datetime,
+    last_start: datetime,
+    activity_types: Iterable[str] = (),
+    exclude_id: Optional[int] = None,
+    entities: bool = False
+) -> list[dict]:
+    """Existing activities of a profile that activities starting between first_start and last_start can end or be ended by.
+
+    That is every activity in the range plus, on each side, the activities
+    at the nearest start time and at the nearest start time of each of
+    activity_types that has the same_type rule. With entities=True each row
+    also carries the loaded Activity under "entity". Archived activities
+    among them are moved back into activities first (see archive.py).
+    """
+    bounds = await get_archive_bounds(db, profile_id)
+    if bounds is not None and first_start <= bounds.last_end:
+        # Archived activities next to this range may end or be ended by
+        # activities in it; move them back so they are read and updated below
+        archived = set()
+        for statement in _neighbour_statements(
+            ArchivedActivity, (ArchivedActivity.id,), profile_id, first_start, last_start, activity_types, exclude_id
+        ):
+            archived.update((await db.execute(statement)).scalars())
+        if archived:
+            await restore_activities(db, ArchivedActivity.id.in_(archived))
+
+    source = (Activity,) if entities else tuple(getattr(Activity, field) for field in CLOSE_FIELDS)
+    statements = _neighbour_statements(
+        Activity, source, profile_id, first_start, last_start, activity_types, exclude_id
+    )
+
+    rows = {}
+    for statement in statements:
+        result = await db.execute(statement)
+        if entities:
+            for activity in result.scalars():
+                rows[activity.id] = {**_fields(activity), "entity": activity}
+        else:
+            for row in result:
+                rows[row.id] = row._asdict()
+    return list(rows.values())
+
+
+def _neighbour_statements(
+    model, source: tuple, profile_id: Optional[int], first_start: datetime, last_start: datetime,
+    activity_types: Iterable[str], exclude_id: Optional[int]
+) -> list:
+    """Selects of source from model's table for the rows load_neighbours() returns."""
+    scope = [model.for_profile(profile_id)]
+    if exclude_id is not None:
+        scope.append(model.id != exclude_id)
+
+    statements = [
+        select(*source).where(*scope, model.start_time >= first_start, model.start_time <= last_start)
+    ]
+    same_types = {activity_type for activity_type in activity_types if close_rule(activity_type) == CLOSE_SAME_TYPE}
+    for activity_type in (None, *sorted(same_types)):
+        type_scope = scope if activity_type is None else [*scope, model.activity_type == activity_type]
+        previous_start = (
+            select(func.max(model.start_time))
+            .where(*type_scope, model.start_time < first_start)
+            .scalar_subquery()
+        )
+        next_start = (
+            select(func.min(model.start_time))
+            .where(*type_scope, model.start_time > last_start)
+            .scalar_subquery()
+        )
+        statements.append(select(*source).where(*type_scope, model.start_time == previous_start))
+        statements.append(select(*source).where(*type_scope, model.start_time == next_start))
+    return statements
+
+
+def _fields(activity: Activity) -> dict:
+    row = {field: getattr(activity, field) for field in CLOSE_FIELDS}
+    # Not yet set on activities that were never flushed
+    row["auto_closed"] = bool(row["auto_closed"])
+    return row
+
+
+def _set_end(row: dict, touched: dict):
+    """Copy a row's new end onto its Activity, remembering the activity's state before the first change."""
+    activity = row["entity"]
+    touched.setdefault(activity, snapshot(activity))
+    activity.end_time = row["end_time"]
+    activity.auto_closed = row["auto_closed"]
+
+
+async def auto_close(db: AsyncSession, activity: Activity, touched: dict):
+    """Apply the close rules for an activity that is being inserted or was moved.
+
+    Earlier activities it ends and, if it is open, its own end are updated
+    in the session. Other activities that change are added to touched,
+    mapped to their rollup snapshot before the change.
+    """
+    rows = await load_neighbours(
+        db, activity.profile_id, activity.start_time, activity.start_time,
+        [activity.activity_type], exclude_id=activity.id, entities=True
+    )
+    row = _fields(activity)
+    for previous, _ in apply_close_rules(rows, [row]):
+        _set_end(previous, touched)
+    activity.end_time = row["end_time"]
+    activity.auto_closed = row["auto_closed"]
+
+
+async def release(db: AsyncSession, activity: Activity, touched: dict):
+    """Re-end the activities that activity auto-closed, before it is moved or deleted.
+
+    Each of them is ended by its next closer instead, or reopened if there
+    is none. Changed activities are added to touched like in auto_close().
+    """
+    rows = await load_neighbours(
+        db, activity.profile_id, activity.start_time, activity.start_time,
+        [activity.activity_type], exclude_id=activity.id, entities=True
+    )
+    reopened = [
+        row for row in rows
+        if row["start_time"] < activity.start_time
+        and row["auto_closed"]
+        and row["end_time"] == activity.start_time
+        and closes(activity.activity_type, row["activity_type"])
+    ]
+    if not reopened:
+        return
+
+    reopened_ids = {id(row) for row in reopened}
+    for row in reopened:
+        row["end_time"] = None
+        row["auto_closed"] = False
+    closed = apply_close_rules([row for row in rows if id(row) not in reopened_ids], reopened)
+    for row in [*reopened, *(previous for previous, _ in closed)]:
+        _set_end(row, touched)
+
+
+def touched_changes(touched: dict) -> list[tuple]:
+    """Rollup (before, after) pairs for the activities collected by auto_close() and release()."""
+    return [(before, snapshot(activity)) for activity, before in touched.items()]
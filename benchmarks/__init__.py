@@ -0,0 +1,6 @@
+"""Performance benchmarks, synthetic data and a load driver.
+
+Everything here runs against the database named by DATABASE_URL, which must
+be set before the application modules are imported. See the Benchmarks
+section of the README.
+"""
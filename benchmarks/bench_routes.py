@@ -0,0 +1,74 @@
+"""Microbenchmarks of the API and page routes.
+
+    BENCH_ROWS=100000 pytest benchmarks/bench_routes.py
+
+Compare runs with pytest-benchmark's --benchmark-autosave and
+--benchmark-compare to catch regressions as the history grows.
+"""
+import itertools
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+_minutes = itertools.count(1)
+
+
+def test_create_activity(benchmark, bench_client):
+    # Each round logs a new activity after all existing ones, like a live entry
+    now = datetime.now(timezone.utc)
+
+    def create():
+        start = now + timedelta(minutes=next(_minutes))
+        bench_client.request("POST", "/api/activities/", json={
+            "activity_type": "diaper", "start_time": start.isoformat(), "role": "Mom"
+        })
+
+    benchmark(create)
+
+
+def test_list_activities_first_page(benchmark, bench_client):
+    benchmark(bench_client.request, "GET", "/api/activities/?limit=100")
+
+
+def test_list_activities_deep_page(benchmark, bench_client):
+    # Walk a few pages in to get a cursor into older history
+    cursor = None
+    for _ in range(5):
+        page = bench_client.request("GET", "/api/activities/", params={"limit": 1000, "cursor": cursor}).json()
+        cursor = page["next_cursor"] or cursor
+    benchmark(bench_client.request, "GET", "/api/activities/", params={"limit": 100, "cursor": cursor})
+
+
+def test_activity_stats(benchmark, bench_client):
+    benchmark(bench_client.request, "GET", "/api/activities/stats")
+
+
+def test_dashboard_page(benchmark, bench_client):
+    benchmark(bench_client.request, "GET", "/")
+
+
+def test_analytics_page(benchmark, bench_client):
+    benchmark(bench_client.request, "GET", "/analytics")
+
+
+def test_timeline_page(benchmark, bench_client):
+    benchmark(bench_client.request, "GET", "/timeline")
+
+
+def test_insights_memoized(benchmark, bench_client):
+    url = f"/api/insights/{bench_client.profile_ids[0]}"
+    bench_client.request("GET", url)
+    benchmark(bench_client.request, "GET", url)
+
+
+def test_insights_recomputed(benchmark, bench_client):
+    from httpcache import data_version
+
+    # As if a write had just happened, so every round loads and analyses the history
+    def recompute():
+        data_version.bump()
+        bench_client.request("GET", f"/api/insights/{bench_client.profile_ids[0]}")
+
+    benchmark(recompute)
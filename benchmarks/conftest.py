@@ -0,0 +1,53 @@
+import asyncio
+import os
+import sys
+from dataclasses import dataclass
+
+import pytest
+
+# Size of the synthetic history the routes are measured against
+BENCH_ROWS = int(os.getenv("BENCH_ROWS", "10000"))
+BENCH_PROFILES = int(os.getenv("BENCH_PROFILES", "1"))
+
+
+@dataclass
+class BenchClient:
+    """An httpx client on the ASGI app plus the event loop that drives it."""
+    loop: asyncio.AbstractEventLoop
+    client: object
+    profile_ids: list
+
+    def request(self, method: str, url: str, **kwargs):
+        response = self.loop.run_until_complete(self.client.request(method, url, **kwargs))
+        assert response.status_code < 400, response.text
+        return response
+
+
+@pytest.fixture(scope="session")
+def bench_client(tmp_path_factory):
+    """The application on a temporary SQLite file holding BENCH_ROWS synthetic activities."""
+    httpx = pytest.importorskip("httpx")
+    if "config" in sys.modules:
+        pytest.skip("benchmarks must run in their own pytest process")
+
+    database_path = tmp_path_factory.mktemp("bench") / "bench.db"
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{database_path}"
+
+    from benchmarks.datagen import populate
+
+    loop = asyncio.new_event_loop()
+    profile_ids = loop.run_until_complete(populate(BENCH_ROWS, BENCH_PROFILES))
+
+    from database import engine
+    from main import app
+
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://bench",
+        cookies={"profile_id": str(profile_ids[0])},
+    )
+    yield BenchClient(loop, client, profile_ids)
+
+    loop.run_until_complete(client.aclose())
+    loop.run_until_complete(engine.dispose())
+    loop.close()
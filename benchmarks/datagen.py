@@ -0,0 +1,150 @@
+"""Synthetic activity histories for benchmarks.
+
+Each profile gets a day/night rhythm of sleeps, each followed by a diaper
+change and a feeding, ending about now. Diaper changes are logged open and
+ended by the next activity, like the auto-close of the write routes with
+the default rule. About 17 activities are generated per profile and day,
+so one million rows is roughly 160 years of single-baby history or three
+years for 55 profiles.
+
+    DATABASE_URL=sqlite+aiosqlite:///./bench.db python -m benchmarks.datagen --rows 100000 --profiles 4
+"""
+import argparse
+import asyncio
+import random
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator, Optional
+
+from sqlalchemy import insert, select
+
+# Rough generation rate, used to pick a first start date
+ROWS_PER_DAY_ESTIMATE = 16.5
+
+INSERT_BATCH_SIZE = 10000
+
+ROLES = ["Mom", "Dad", "Grandparent", "Caregiver"]
+NOTES = ["", "", "", "", "fussy", "good latch", "slept in car seat", "blowout", "left side"]
+
+
+def generate_profile_activities(
+    profile_id: int, rows: int, seed: int = 0, end: Optional[datetime] = None
+) -> Iterator[dict]:
+    """Yield rows for one profile in start_time order as insert() parameter dicts."""
+    from models import derived_fields
+
+    seed_key = f"{seed}-{profile_id}"
+    end = end or datetime.now(timezone.utc)
+    moment = end - timedelta(days=rows / ROWS_PER_DAY_ESTIMATE)
+
+    # Dry run to find where the history ends, then shift it by whole days
+    # (keeping the day/night rhythm) so that it ends within a day before end
+    last_start = moment
+    for row in _rhythm(random.Random(seed_key), profile_id, moment, rows):
+        last_start = row["start_time"]
+    moment += timedelta(days=(end - last_start).days)
+
+    previous = None
+    for row in _rhythm(random.Random(seed_key), profile_id, moment, rows):
+        if previous is not None:
+            if previous["end_time"] is None:
+                previous["end_time"] = row["start_time"]
+                previous["auto_closed"] = True
+            previous.update(derived_fields(previous["start_time"], previous["end_time"]))
+            yield previous
+        previous = row
+    if previous is not None:
+        previous.update(derived_fields(previous["start_time"], previous["end_time"]))
+        yield previous
+
+
+def _rhythm(rng: random.Random, profile_id: int, moment: datetime, rows: int) -> Iterator[dict]:
+    count = 0
+    while count < rows:
+        night = moment.hour >= 20 or moment.hour < 6
+        sleep_hours = rng.uniform(3, 6) if night else rng.uniform(0.5, 2.5)
+        wake = moment + timedelta(hours=sleep_hours)
+        feed_start = wake + timedelta(minutes=rng.randint(2, 10))
+        feed_end = feed_start + timedelta(minutes=rng.randint(10, 40))
+        role = rng.choice(ROLES)
+
+        for activity_type, start, finish in (
+            ("sleep", moment, wake),
+            ("diaper", wake, None),
+            ("feeding", feed_start, feed_end),
+        ):
+            if count == rows:
+                return
+            yield {
+                "profile_id": profile_id,
+                "activity_type": activity_type,
+                "start_time": start,
+                "end_time": finish,
+                "auto_closed": False,
+                "notes": rng.choice(NOTES) or None,
+                "role": role,
+                "created_at": start,
+            }
+            count += 1
+
+        awake_hours = rng.uniform(0.25, 0.75) if night else rng.uniform(0.75, 2.5)
+        moment = feed_end + timedelta(hours=awake_hours)
+
+
+async def populate(rows: int, profiles: int = 1, seed: int = 0) -> list[int]:
+    """Create profiles and about rows activities split evenly between them.
+
+    Rollups are rebuilt and every activity is added to the sync change log
+    afterwards. Returns the new profile ids.
+    """
+    from database import engine, init_db
+    from models import Activity, ActivityChange, BabyProfile
+    from rollups import rebuild
+
+    await init_db()
+    async with engine.begin() as conn:
+        profile_ids = []
+        for number in range(profiles):
+            result = await conn.execute(
+                insert(BabyProfile).returning(BabyProfile.id),
+                {"name": f"Baby {number + 1}", "birthday": date.today() - timedelta(days=365),
+                 "created_at": datetime.now(timezone.utc)}
+            )
+            profile_ids.append(result.scalar_one())
+
+        per_profile, remainder = divmod(rows, profiles)
+        for index, profile_id in enumerate(profile_ids):
+            batch = []
+            count = per_profile + (1 if index < remainder else 0)
+            for row in generate_profile_activities(profile_id, count, seed):
+                batch.append(row)
+                if len(batch) == INSERT_BATCH_SIZE:
+                    await conn.execute(insert(Activity), batch)
+                    batch = []
+            if batch:
+                await conn.execute(insert(Activity), batch)
+
+        await conn.run_sync(rebuild)
+        await conn.execute(
+            insert(ActivityChange).from_select(
+                ["activity_id", "profile_id"],
+                select(Activity.id, Activity.profile_id).where(Activity.profile_id.in_(profile_ids)).order_by(Activity.id)
+            )
+        )
+    return profile_ids
+
+
+async def _main(rows: int, profiles: int, seed: int):
+    from database import engine
+
+    profile_ids = await populate(rows, profiles, seed)
+    await engine.dispose()
+    print(f"Generated {rows} activities for profiles {profile_ids}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the configured database with synthetic activities")
+    parser.add_argument("--rows", type=int, default=10000, help="total number of activities")
+    parser.add_argument("--profiles", type=int, default=1, help="number of baby profiles")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+    asyncio.run(_main(args.rows, args.profiles, args.seed))
@@ -0,0 +1,162 @@
+"""Concurrent load driver reporting latency percentiles and throughput.
+
+Against a running server:
+
+    python -m benchmarks.load --url http://localhost:7999 --concurrency 20 --duration 30
+
+Without --url the application is driven in-process through httpx's ASGI
+transport, on a temporary SQLite file filled with --rows synthetic
+activities. ``--mix quick_add`` sends only activity creates, the traffic
+WRITE_QUEUE batches:
+
+    WRITE_QUEUE=true python -m benchmarks.load --mix quick_add --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+# Relative weight of each request in the generated traffic
+DEFAULT_MIX = {
+    "dashboard": 4,
+    "list_activities": 3,
+    "timeline": 2,
+    "analytics": 1,
+    "create_activity": 1,
+}
+
+MIXES = {
+    "default": DEFAULT_MIX,
+    # Bursts of quick-add buttons
+    "quick_add": {"create_activity": 1},
+}
+
+
+def _request(name: str, sequence: int) -> tuple:
+    """Method, URL and keyword arguments of one request of a kind."""
+    if name == "dashboard":
+        return "GET", "/", {}
+    if name == "list_activities":
+        return "GET", "/api/activities/", {"params": {"limit": 100}}
+    if name == "timeline":
+        return "GET", "/timeline", {}
+    if name == "analytics":
+        return "GET", "/analytics", {}
+    if name == "create_activity":
+        start = datetime.now(timezone.utc) + timedelta(seconds=sequence)
+        return "POST", "/api/activities/", {"json": {"activity_type": "diaper", "start_time": start.isoformat()}}
+    raise ValueError(f"Unknown request kind: {name}")
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_load(client: httpx.AsyncClient, concurrency: int, duration: float, mix: dict) -> dict:
+    """Send requests from concurrency workers for duration seconds.
+
+    Returns latencies in seconds per request kind, error counts and the
+    elapsed time.
+    """
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    sequence = iter(range(10 ** 9))
+    deadline = time.perf_counter() + duration
+
+    async def worker(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            method, url, kwargs = _request(name, next(sequence))
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[name].append(time.perf_counter() - started)
+            if failed:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(seed) for seed in range(concurrency)))
+    return {"latencies": latencies, "errors": errors, "elapsed": time.perf_counter() - started}
+
+
+def format_report(results: dict) -> str:
+    lines = [f"{'request':<18}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}"]
+    elapsed = results["elapsed"]
+    everything = []
+    for name, values in sorted(results["latencies"].items()):
+        values = sorted(values)
+        everything.extend(values)
+        lines.append(_report_line(name, values, results["errors"][name], elapsed))
+    lines.append(_report_line("total", sorted(everything), sum(results["errors"].values()), elapsed))
+    return "\n".join(lines)
+
+
+def _report_line(name: str, values: list, errors: int, elapsed: float) -> str:
+    return (
+        f"{name:<18}{len(values):>8}{errors:>8}"
+        f"{percentile(values, 0.50) * 1000:>10.1f}"
+        f"{percentile(values, 0.95) * 1000:>10.1f}"
+        f"{percentile(values, 0.99) * 1000:>10.1f}"
+        f"{len(values) / elapsed:>10.1f}"
+    )
+
+
+async def _in_process_client(rows: int, profiles: int) -> httpx.AsyncClient:
+    database_path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{database_path}"
+
+    from benchmarks.datagen import populate
+
+    profile_ids = await populate(rows, profiles)
+
+    from main import app
+
+    print(f"Loaded {rows} activities into {database_path}")
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://bench",
+        cookies={"profile_id": str(profile_ids[0])},
+    )
+
+
+async def _main(args):
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            results = await run_load(client, args.concurrency, args.duration, MIXES[args.mix])
+    else:
+        client = await _in_process_client(args.rows, args.profiles)
+
+        from main import app
+
+        # Startup and shutdown run as in a server, which starts the write queue
+        async with client, app.router.lifespan_context(app):
+            results = await run_load(client, args.concurrency, args.duration, MIXES[args.mix])
+    print(format_report(results))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive concurrent traffic and report latency percentiles")
+    parser.add_argument("--url", help="base URL of a running server; default: in-process on a temporary database")
+    parser.add_argument("--concurrency", type=int, default=10, help="number of concurrent workers")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default", help="request mix")
+    parser.add_argument("--timeout", type=float, default=30.0, help="request timeout in seconds")
+    parser.add_argument("--rows", type=int, default=10000, help="synthetic activities for in-process runs")
+    parser.add_argument("--profiles", type=int, default=1, help="synthetic profiles for in-process runs")
+    asyncio.run(_main(parser.parse_args()))
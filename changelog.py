@@ -0,0 +1,119 @@
+"""Activity change log behind the offline sync protocol.
+
+Write paths call record_changes() with the (activity_id, profile_id) pairs
+they touched, in the same transaction as the write, just as they call
+rollups.apply_changes(). Every pair gets a new, increasing seq. A client
+keeps the highest seq it has seen as its sync version and asks
+get_changes() for everything after it: activities that still belong to the
+profile come back with their current state, whether archived or not, the
+others (deleted or moved away) as tombstone ids.
+
+A seq must never be committed after a higher one that a client could
+already have read. SQLite runs one write transaction at a time; on
+PostgreSQL record_changes() takes a transaction-level advisory lock, so
+writes that log changes commit in seq order.
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from activity_rows import activity_dicts, select_activity_rows
+from archive import get_archive_bounds
+from models import Activity, ActivityChange, ArchivedActivity
+
+# Activities returned by one sync request unless the client asks for fewer
+DEFAULT_SYNC_LIMIT = 1000
+
+# PostgreSQL advisory lock key serializing writers of the change log
+CHANGE_LOG_LOCK_KEY = 0x5E9C
+
+
+class SyncVersionError(ValueError):
+    pass
+
+
+def changed(activity) -> tuple:
+    """Change log entry of an activity or activity row dict."""
+    if isinstance(activity, dict):
+        return (activity["id"], activity["profile_id"])
+    return (activity.id, activity.profile_id)
+
+
+async def record_changes(db: AsyncSession, changes: Iterable[tuple]):
+    """Append (activity_id, profile_id) entries to the log in the current transaction."""
+    rows = [{"activity_id": activity_id, "profile_id": profile_id} for activity_id, profile_id in set(changes)]
+    if rows:
+        if db.get_bind().dialect.name == "postgresql":
+            # Held until commit; sequence values alone are not assigned in commit order
+            await db.execute(select(func.pg_advisory_xact_lock(CHANGE_LOG_LOCK_KEY)))
+        await db.execute(insert(ActivityChange), rows)
+
+
+async def get_sync_version(db: AsyncSession) -> int:
+    """Highest seq in the log; pages embed it so they can catch up later."""
+    return (await db.execute(select(func.max(ActivityChange.seq)))).scalar() or 0
+
+
+async def delete_profile_changes(db: AsyncSession, profile_id: int):
+    """Drop the log of a deleted profile."""
+    await db.execute(delete(ActivityChange).where(ActivityChange.profile_id == profile_id))
+
+
+async def get_changes(
+    db: AsyncSession,
+    profile_id: Optional[int],
+    since: int,
+    limit: int = DEFAULT_SYNC_LIMIT
+) -> dict:
+    """Activities of a profile changed after seq since, oldest change first.
+
+    Shaped like SyncPage and ready for ORJSONResponse. When has_more is
+    set, call again with the returned version as since. Each activity
+    appears once, with its latest state, however often it changed.
+    """
+    # Read before the changes: a write committed while this runs is then
+    # sent again on the next sync instead of being skipped
+    current = await get_sync_version(db)
+    if since > current:
+        raise SyncVersionError("Sync version is ahead of the server; sync again from 0")
+
+    latest = func.max(ActivityChange.seq).label("seq")
+    result = await db.execute(
+        select(ActivityChange.activity_id, latest)
+        .where(ActivityChange.for_profile(profile_id), ActivityChange.seq > since)
+        .group_by(ActivityChange.activity_id)
+        .order_by(latest)
+        .limit(limit + 1)
+    )
+    entries = result.all()
+
+    has_more = len(entries) > limit
+    if has_more:
+        entries = entries[:limit]
+        version = entries[-1].seq
+    else:
+        version = current
+
+    activity_ids = [entry.activity_id for entry in entries]
+    activities = {}
+    if activity_ids:
+        result = await db.execute(
+            select_activity_rows()
+            .where(Activity.id.in_(activity_ids), Activity.for_profile(profile_id))
+        )
+        activities = {activity["id"]: activity for activity in activity_dicts(result)}
+        archived_ids = [activity_id for activity_id in activity_ids if activity_id not in activities]
+        if archived_ids and await get_archive_bounds(db, profile_id) is not None:
+            result = await db.execute(
+                select_activity_rows(ArchivedActivity)
+                .where(ArchivedActivity.id.in_(archived_ids), ArchivedActivity.for_profile(profile_id))
+            )
+            activities.update((activity["id"], activity) for activity in activity_dicts(result))
+
+    return {
+        "version": version,
+        "activities": [activities[activity_id] for activity_id in activity_ids if activity_id in activities],
+        "deleted": [activity_id for activity_id in activity_ids if activity_id not in activities],
+        "has_more": has_more,
+    }
@@ -0,0 +1,83 @@
+import os
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_mapping(name: str) -> dict[str, str]:
+    """Parse a "key=value,key=value" environment variable."""
+    mapping = {}
+    for item in os.getenv(name, "").split(","):
+        if item.strip():
+            key, _, value = item.partition("=")
+            mapping[key.strip()] = value.strip()
+    return mapping
+
+
+class Settings:
+    """Application settings, read from environment variables at startup."""
+
+    def __init__(self):
+        # Database connection: SQLite (aiosqlite) by default, or PostgreSQL
+        # with a postgresql+asyncpg:// URL
+        self.database_url = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./baby_tracker.db")
+        self.db_echo = _env_bool("DB_ECHO", False)
+        self.db_pool_size = _env_int("DB_POOL_SIZE", 5)
+        self.db_max_overflow = _env_int("DB_MAX_OVERFLOW", 10)
+        self.db_pool_timeout = _env_float("DB_POOL_TIMEOUT", 30.0)
+        self.db_pool_recycle = _env_int("DB_POOL_RECYCLE", 3600)
+        # Test pooled connections before use, so ones dropped by the server
+        # (restarts, idle timeouts) are replaced instead of failing a request
+        self.db_pool_pre_ping = _env_bool("DB_POOL_PRE_PING", True)
+        # Statements slower than this are logged with their parameters
+        self.slow_query_ms = _env_float("SLOW_QUERY_MS", 200.0)
+
+        # SQLite tuning, applied to every new connection
+        self.sqlite_journal_mode = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+        self.sqlite_synchronous = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+        self.sqlite_busy_timeout_ms = _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+        self.sqlite_mmap_size = _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+        # Negative values are KiB, so -65536 is a 64 MiB page cache
+        self.sqlite_cache_size = _env_int("SQLITE_CACHE_SIZE", -65536)
+
+        # IANA timezone used to assign activities to local calendar days
+        self.tracker_timezone = os.getenv("TRACKER_TIMEZONE", "UTC")
+
+        # How open activities are ended by later ones (see autoclose.py):
+        # a default rule plus per-activity-type overrides
+        self.auto_close_default = os.getenv("AUTO_CLOSE_DEFAULT", "any")
+        self.auto_close_rules = _env_mapping("AUTO_CLOSE_RULES")
+
+        # Group commit of activity creates and updates (see write_queue.py):
+        # writes arriving within the window share one transaction
+        self.write_queue = _env_bool("WRITE_QUEUE", False)
+        self.write_queue_window_ms = _env_float("WRITE_QUEUE_WINDOW_MS", 2.0)
+        self.write_queue_max_batch = _env_int("WRITE_QUEUE_MAX_BATCH", 64)
+
+        # `python archive.py run` moves completed activities of the local
+        # months that ended at least this many days ago to the archive
+        self.archive_after_days = _env_int("ARCHIVE_AFTER_DAYS", 180)
+
+        # Rendered activity cards kept in memory (see fragments.py)
+        self.fragment_cache_size = _env_int("FRAGMENT_CACHE_SIZE", 5000)
+
+    @property
+    def is_sqlite(self) -> bool:
+        return self.database_url.startswith("sqlite")
+
+
+settings = Settings()
@@ -1,18 +1,61 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker as async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import settings
+from migrations import upgrade
+
+DATABASE_URL = settings.database_url
+
+
+def _engine_options() -> dict:
+    """Engine keyword arguments for the configured database."""
+    options = {"echo": settings.db_echo, "future": True}
+
+    database = make_url(DATABASE_URL).database
+    if settings.is_sqlite and database in (None, "", ":memory:"):
+        # In-memory SQLite must keep its single connection
+        return options
+
+    pool_options = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if settings.is_sqlite:
+        # aiosqlite defaults to opening a new connection per session; pool
+        # them instead so per-connection caches and pragmas are reused
+        pool_options["poolclass"] = AsyncAdaptedQueuePool
+    return {**options, **pool_options}
 
-# SQLite database URL
-DATABASE_URL = "sqlite+aiosqlite:///./baby_tracker.db"
 
 # Create async engine
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=True,  # Set to False in production
-    future=True
-)
+engine = create_async_engine(DATABASE_URL, **_engine_options())
+
+
+if settings.is_sqlite:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Configure each new SQLite connection for concurrent access.
+
+        WAL lets readers proceed while a writer commits, and busy_timeout
+        makes writers wait for the lock instead of failing immediately with
+        "database is locked".
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms:d}")
+        cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size:d}")
+        cursor.execute(f"PRAGMA cache_size={settings.sqlite_cache_size:d}")
+        cursor.close()
+
 
 # Create async session factory
 async_session = async_sessionmaker(
@@ -29,7 +72,7 @@ async def get_db():
         yield session
 
 
-# Initialize database (create tables)
+# Initialize database (apply pending Alembic migrations)
 async def init_db():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade)
@@ -0,0 +1,164 @@
+"""Streaming export of activity history.
+
+Rows are read with a server-side cursor in batches of EXPORT_BATCH_SIZE and
+encoded batch by batch, so memory use does not grow with the amount of
+history. Each export opens its own session: the response body is produced
+after the route returns, when the request's session may already be closed.
+Archived activities are merged in start_time order by
+archive.tiered_queries().
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select
+
+from archive import tiered_queries
+from database import async_session
+
+# Rows fetched from the database and encoded per chunk
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = (
+    "id", "profile_id", "activity_type", "start_time", "end_time", "notes", "role", "created_at"
+)
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional
+    pyarrow = None
+
+
+class ExportFormatError(ValueError):
+    pass
+
+
+def check_export_format(fmt: str):
+    """Reject formats that are unknown or need a missing optional dependency."""
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise ExportFormatError(f"Unsupported export format: {fmt}")
+    if fmt == "parquet" and pyarrow is None:
+        raise ExportFormatError("Parquet export requires the pyarrow package")
+
+
+def _export_rows(
+    profile_id: Optional[int],
+    activity_type: Optional[str],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+):
+    """Builder of the export select for tiered_queries()."""
+    def build(model):
+        # Plain columns instead of ORM objects: nothing is added to an identity map
+        query = select(*(getattr(model, column) for column in EXPORT_COLUMNS)).where(model.for_profile(profile_id))
+        if activity_type:
+            query = query.where(model.activity_type == activity_type)
+        if start_date:
+            query = query.where(model.start_time >= start_date)
+        if end_date:
+            query = query.where(model.start_time <= end_date)
+        return query
+    return build
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _csv_chunk(rows, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(
+            "" if value is None else _isoformat(value) if isinstance(value, datetime) else value
+            for value in row
+        )
+    return buffer.getvalue().encode()
+
+
+def _ndjson_chunk(rows) -> bytes:
+    lines = []
+    for row in rows:
+        item = {
+            column: _isoformat(value) if isinstance(value, datetime) else value
+            for column, value in zip(EXPORT_COLUMNS, row)
+        }
+        lines.append(json.dumps(item))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _parquet_schema():
+    timestamp = pyarrow.timestamp("us", tz="UTC")
+    return pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("profile_id", pyarrow.int64()),
+        ("activity_type", pyarrow.string()),
+        ("start_time", timestamp),
+        ("end_time", timestamp),
+        ("notes", pyarrow.string()),
+        ("role", pyarrow.string()),
+        ("created_at", timestamp),
+    ])
+
+
+async def _iter_parquet(batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """Write one Parquet row group per batch and yield the bytes written so far."""
+    schema = _parquet_schema()
+    sink = io.BytesIO()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    async for rows in batches:
+        columns = list(zip(*rows))
+        writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema,
+        ))
+        yield _drain(sink)
+    writer.close()
+    yield _drain(sink)
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+async def _iter_batches(profile_id: Optional[int], build) -> AsyncIterator[list]:
+    async with async_session() as session:
+        for query in await tiered_queries(session, profile_id, build, descending=False):
+            result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for rows in result.partitions():
+                yield rows
+
+
+async def iter_export(
+    fmt: str,
+    profile_id: Optional[int] = None,
+    activity_type: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> AsyncIterator[bytes]:
+    """Yield the encoded export oldest first, one chunk per batch of rows."""
+    batches = _iter_batches(profile_id, _export_rows(profile_id, activity_type, start_date, end_date))
+    if fmt == "parquet":
+        async for chunk in _iter_parquet(batches):
+            if chunk:
+                yield chunk
+        return
+
+    if fmt == "csv":
+        yield _csv_chunk((), header=True)
+    async for rows in batches:
+        yield _csv_chunk(rows) if fmt == "csv" else _ndjson_chunk(rows)
@@ -0,0 +1,85 @@
+"""Cache of rendered activity cards.
+
+The dashboard and timeline show one card per activity, and on a long
+history nearly all of them are for activities that have not changed in
+months. Templates render cards through the activity_card() global, which
+keeps each card's markup in memory keyed by activity id and version and
+renders it again only when the version changes. The version is the tuple
+of columns the card shows, so a cached card is never out of date, whatever
+process changed the activity. Write routes also call
+fragment_cache.invalidate() for the activities they changed, so that
+superseded markup does not wait for eviction.
+
+At most FRAGMENT_CACHE_SIZE activities are cached, least recently used
+evicted first. Like the profile cache, this lives in process memory.
+"""
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from jinja2 import Environment, pass_environment
+from markupsafe import Markup
+
+from activity_rows import ActivityRow
+from config import settings
+from metrics import metrics
+
+CARD_TEMPLATE = "activity_card.html"
+
+# Columns an activity card shows; their values are the card's version
+CARD_FIELDS = ("activity_type", "start_time", "end_time", "duration_seconds", "role", "notes")
+
+_MISSING = object()
+
+
+class FragmentCache:
+    """LRU of rendered cards by activity id, each with the version it was rendered from."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # activity id -> (version, {layout: markup})
+        self._entries: OrderedDict[int, tuple[tuple, dict]] = OrderedDict()
+
+    def get(self, activity_id: int, version: tuple, layout: tuple) -> Optional[Markup]:
+        entry = self._entries.get(activity_id)
+        if entry is None or entry[0] != version:
+            return None
+        self._entries.move_to_end(activity_id)
+        return entry[1].get(layout)
+
+    def put(self, activity_id: int, version: tuple, layout: tuple, markup: Markup):
+        entry = self._entries.get(activity_id)
+        if entry is None or entry[0] != version:
+            entry = self._entries[activity_id] = (version, {})
+        entry[1][layout] = markup
+        self._entries.move_to_end(activity_id)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, activity_ids: Iterable[int] = _MISSING):
+        """Drop the cards of some activities, or of all of them."""
+        if activity_ids is _MISSING:
+            self._entries.clear()
+            return
+        for activity_id in activity_ids:
+            self._entries.pop(activity_id, None)
+
+
+fragment_cache = FragmentCache(settings.fragment_cache_size)
+
+
+@pass_environment
+async def activity_card(
+    environment: Environment, activity: ActivityRow, time_format: str, extra_class: str = ""
+) -> Markup:
+    """Template global: the card of an ActivityRow, from the cache when it is current."""
+    version = tuple(activity[field] for field in CARD_FIELDS)
+    layout = (time_format, extra_class)
+    markup = fragment_cache.get(activity["id"], version, layout)
+    metrics.observe_fragment(markup is not None)
+    if markup is None:
+        template = environment.get_template(CARD_TEMPLATE)
+        markup = Markup(await template.render_async(
+            activity=activity, time_format=time_format, extra_class=extra_class
+        ))
+        fragment_cache.put(activity["id"], version, layout, markup)
+    return markup
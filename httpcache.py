@@ -0,0 +1,95 @@
+"""Conditional GET support based on a global data version.
+
+Every write route bumps ``data_version`` after committing. GET routes depend
+on ``api_etag`` or ``page_etag``, which derive an ETag from the version and
+answer ``304 Not Modified`` before the route runs any query when the client
+already has the current representation.
+
+The version lives in process memory, like the profile cache and the event
+bus, so this assumes a single application process. A random boot token is
+part of every ETag so validators from before a restart never match.
+"""
+import secrets
+from datetime import date
+
+from fastapi import HTTPException, Request, Response
+
+from profile_cache import PROFILE_COOKIE
+
+# Clients may reuse a response only after revalidating it
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class DataVersion:
+    """Monotonic counter of committed writes."""
+
+    def __init__(self):
+        self.boot_token = secrets.token_hex(4)
+        self.value = 0
+
+    def bump(self):
+        self.value += 1
+
+    def etag(self, *parts) -> str:
+        tag = ".".join(str(part) for part in (self.boot_token, self.value, *parts))
+        return f'W/"{tag}"'
+
+
+data_version = DataVersion()
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/ prefixes are ignored
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+# Responses depend on the profile selected through the profile cookie
+CACHE_HEADERS = {"Cache-Control": REVALIDATE_CACHE_CONTROL, "Vary": "Cookie"}
+
+
+def _selected_profile(request: Request) -> str:
+    return request.cookies.get(PROFILE_COOKIE, "")
+
+
+def check_not_modified(request: Request, etag: str) -> str:
+    """Raise 304 if the request already holds etag; otherwise remember it for the response."""
+    headers = {"ETag": etag, **CACHE_HEADERS}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        raise HTTPException(status_code=304, headers=headers)
+    request.state.etag = etag
+    return etag
+
+
+def api_etag(request: Request, response: Response) -> str:
+    """Dependency for JSON GET routes: short-circuit with 304 or set the ETag header."""
+    etag = check_not_modified(request, data_version.etag(_selected_profile(request)))
+    response.headers.update({"ETag": etag, **CACHE_HEADERS})
+    return etag
+
+
+def check_api_etag(request: Request, *parts) -> str:
+    """Like api_etag, for JSON routes that also depend on values resolved in the route.
+
+    Call it before running any query and copy the ETag onto the response
+    with apply_etag.
+    """
+    return check_not_modified(request, data_version.etag(_selected_profile(request), *parts))
+
+
+def page_etag(request: Request) -> str:
+    """Dependency for HTML pages, which also show today's date and the baby's age."""
+    return check_not_modified(
+        request, data_version.etag(_selected_profile(request), date.today().isoformat())
+    )
+
+
+def apply_etag(request: Request, response: Response) -> Response:
+    """Copy the ETag chosen by page_etag onto a response built by the route."""
+    etag = getattr(request.state, "etag", None)
+    if etag:
+        response.headers.update({"ETag": etag, **CACHE_HEADERS})
+    return response
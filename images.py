@@ -0,0 +1,136 @@
+"""Profile photo processing.
+
+Uploaded photos are hashed and re-encoded into a few fixed-size variants in
+WebP and JPEG. Variant files are named after the content hash, so a URL
+never changes meaning and can be cached by browsers indefinitely. All file
+and Pillow work runs in the thread pool to keep the event loop free.
+"""
+import hashlib
+import re
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from fastapi import UploadFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+
+# Define upload directory
+UPLOAD_DIR = Path("static/uploads/profiles")
+UPLOAD_URL = "/static/uploads/profiles"
+
+# Variant name -> (edge length in pixels, crop to square)
+PHOTO_SIZES = {
+    "sm": (160, True),    # navbar / dashboard banner
+    "md": (240, True),    # settings page
+    "lg": (1024, False),  # full view
+}
+
+# Variant format -> (file extension, Pillow save options)
+PHOTO_FORMATS = {
+    "webp": ("webp", {"format": "WEBP", "quality": 80, "method": 4}),
+    "jpeg": ("jpg", {"format": "JPEG", "quality": 85, "optimize": True, "progressive": True}),
+}
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_VARIANT_PATTERN = re.compile(r"^(?P<base>.*/[0-9a-f]{16})-(sm|md|lg)\.(jpg|webp)$")
+
+
+class InvalidImageError(ValueError):
+    """Raised when an upload is not an image Pillow can read."""
+
+
+def _content_hash(file: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    file.seek(0)
+    while chunk := file.read(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()[:16]
+
+
+def _variant_path(key: str, size: str, extension: str) -> Path:
+    return UPLOAD_DIR / f"{key}-{size}.{extension}"
+
+
+def _process_photo(file: BinaryIO) -> str:
+    """Write all variants of an uploaded photo; returns the content key."""
+    key = _content_hash(file)
+    if all(
+        _variant_path(key, size, extension).exists()
+        for size in PHOTO_SIZES
+        for extension, _ in PHOTO_FORMATS.values()
+    ):
+        # Same photo uploaded before
+        return key
+
+    try:
+        with Image.open(file) as original:
+            image = ImageOps.exif_transpose(original).convert("RGB")
+    except (UnidentifiedImageError, OSError):
+        raise InvalidImageError("Unsupported image file")
+
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    for size, (edge, square) in PHOTO_SIZES.items():
+        if square:
+            variant = ImageOps.fit(image, (edge, edge), Image.Resampling.LANCZOS)
+        else:
+            variant = image.copy()
+            variant.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+
+        for extension, options in PHOTO_FORMATS.values():
+            target = _variant_path(key, size, extension)
+            # Write to a temporary name first so readers never see partial files
+            partial = target.with_suffix(target.suffix + ".part")
+            variant.save(partial, **options)
+            partial.replace(target)
+
+    return key
+
+
+async def store_profile_photo(photo: UploadFile) -> str:
+    """Process an uploaded photo off the event loop; returns its photo_path.
+
+    The stored path is the large JPEG variant; use photo_variant_url() to get
+    the other sizes and formats.
+    """
+    key = await run_in_threadpool(_process_photo, photo.file)
+    return f"{UPLOAD_URL}/{key}-lg.jpg"
+
+
+def photo_variant_url(photo_path: Optional[str], size: str = "sm", fmt: str = "jpeg") -> Optional[str]:
+    """URL of a photo variant; photos stored before variants existed are returned as is."""
+    if not photo_path:
+        return photo_path
+    match = _VARIANT_PATTERN.match(photo_path)
+    if not match:
+        return photo_path
+    extension, _ = PHOTO_FORMATS[fmt]
+    return f"{match.group('base')}-{size}.{extension}"
+
+
+def is_variant_file(name: str) -> bool:
+    """Whether a file name is a content-hashed photo variant."""
+    return _VARIANT_PATTERN.match(f"/{name}") is not None
+
+
+def _delete_photo_files(photo_path: str):
+    match = _VARIANT_PATTERN.match(photo_path)
+    if match:
+        paths = [
+            Path(photo_variant_url(photo_path, size, fmt).lstrip("/"))
+            for size in PHOTO_SIZES
+            for fmt in PHOTO_FORMATS
+        ]
+    else:
+        paths = [Path(photo_path.lstrip("/"))]
+
+    for path in paths:
+        if path.exists():
+            path.unlink()
+
+
+async def delete_profile_photo(photo_path: Optional[str]):
+    """Remove all stored files of a photo."""
+    if photo_path:
+        await run_in_threadpool(_delete_photo_files, photo_path)
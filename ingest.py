@@ -0,0 +1,134 @@
+import json
+from collections import defaultdict
+from typing import AsyncIterator, Iterable, Optional
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert, update
+
+from autoclose import apply_close_rules, load_neighbours
+from models import Activity, derived_fields
+from rollups import apply_changes
+from changelog import changed, record_changes
+from schemas import ActivityCreate, BulkImportError, BulkImportResult
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def is_ndjson(content_type: str) -> bool:
+    """Check whether a request content type denotes newline-delimited JSON."""
+    return content_type.split(";")[0].strip().lower() in NDJSON_CONTENT_TYPES
+
+
+def parse_json_array(body: bytes) -> list:
+    """Parse a JSON array request body."""
+    try:
+        items = json.loads(body)
+    except ValueError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(items, list):
+        raise ValueError("Expected a JSON array of activities")
+    return items
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple]:
+    """Yield (item, error) pairs from a streamed NDJSON body, one per non-blank line."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+def _parse_line(line: bytes) -> tuple:
+    try:
+        return json.loads(line), None
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+
+
+def validate_item(item) -> ActivityCreate:
+    """Validate one imported item, raising ValueError with a readable message."""
+    try:
+        return ActivityCreate.model_validate(item)
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" if err["loc"] else err["msg"]
+            for err in e.errors()
+        ))
+
+
+async def import_activities(
+    db: AsyncSession,
+    activities: list[ActivityCreate],
+    errors: Iterable[BulkImportError] = (),
+    default_profile_id: Optional[int] = None
+) -> BulkImportResult:
+    """Insert a batch of activities in a single transaction.
+
+    Items without a profile_id are assigned to default_profile_id. Per
+    profile, the auto-close rules of create_activity (see autoclose.py) are
+    applied in memory across the batch and the existing activities it is
+    interleaved with. New rows and closed existing rows are then written
+    with one executemany each and a single commit.
+
+    The result's closed count covers every activity the batch auto-closed,
+    existing ones and those of the batch itself.
+    """
+    errors = list(errors)
+    if not activities:
+        return BulkImportResult(created=0, closed=0, errors=errors)
+
+    rows_by_profile = defaultdict(list)
+    for activity in activities:
+        row = activity.model_dump()
+        if row["profile_id"] is None:
+            row["profile_id"] = default_profile_id
+        row["auto_closed"] = False
+        rows_by_profile[row["profile_id"]].append(row)
+
+    new_rows = []
+    closed = []
+    for profile_id, profile_rows in rows_by_profile.items():
+        existing_rows = await load_neighbours(
+            db, profile_id,
+            min(row["start_time"] for row in profile_rows),
+            max(row["start_time"] for row in profile_rows),
+            {row["activity_type"] for row in profile_rows}
+        )
+        closed.extend(apply_close_rules(existing_rows, profile_rows))
+        new_rows.extend(profile_rows)
+
+    # Bulk statements skip the mapper events that keep derived columns in sync
+    for row in new_rows:
+        row.update(derived_fields(row["start_time"], row["end_time"]))
+
+    rollup_changes = [
+        (_snapshot({**row, "end_time": end_time}), _snapshot(row)) for row, end_time in closed
+    ]
+    rollup_changes.extend((None, _snapshot(row)) for row in new_rows)
+
+    if closed:
+        await db.execute(
+            update(Activity),
+            [
+                {"id": row["id"], "end_time": row["end_time"], "auto_closed": True,
+                 **derived_fields(row["start_time"], row["end_time"])}
+                for row, _ in closed
+            ]
+        )
+    result = await db.execute(insert(Activity).returning(Activity.id, Activity.profile_id), new_rows)
+    await apply_changes(db, rollup_changes)
+    await record_changes(db, [*result.all(), *(changed(row) for row, _ in closed)])
+    await db.commit()
+
+    closed_count = len(closed) + sum(row["auto_closed"] for row in new_rows)
+    return BulkImportResult(created=len(new_rows), closed=closed_count, errors=errors)
+
+
+def _snapshot(row: dict) -> tuple:
+    return (row["profile_id"], row["activity_type"], row["start_time"], row["end_time"])
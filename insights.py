@@ -0,0 +1,253 @@
+"""Feeding and sleep patterns and next-event predictions.
+
+A profile's feedings and sleeps are loaded in one query as a NumPy array of
+(start epoch, duration, type) rows; epochs are computed by the database so
+no datetime object is built per row. Everything else is array arithmetic:
+intervals between feedings, awake windows between sleeps, daily totals with
+7-day rolling averages, starts per local hour and a weekday × hour heatmap.
+
+Predictions are the median recent interval after the last event, using
+intervals that began near the same time of day (babies feed less often at
+night), with the interquartile range as the likely window.
+
+Results only depend on the stored activities, not on the current time, so
+they are memoized per profile until the next write bumps data_version.
+"""
+from datetime import date, datetime, timezone
+from itertools import chain
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import Integer, case, cast, func, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from archive import get_archive_bounds
+from httpcache import data_version
+from models import Activity, ArchivedActivity, LOCAL_TIMEZONE
+
+INSIGHT_TYPES = ("feeding", "sleep")
+
+# Longer gaps between events are taken as untracked time, not intervals
+MAX_INTERVAL_SECONDS = 12 * 3600
+
+# Intervals that started in the last RECENT_DAYS days feed the predictions,
+# preferably those starting within SAME_TIME_HOURS of the last event's hour
+RECENT_DAYS = 14
+SAME_TIME_HOURS = 2
+MIN_SAME_TIME_SAMPLES = 5
+
+# Local days in the daily series, ending with the day of the latest event
+DAILY_SERIES_DAYS = 30
+ROLLING_DAYS = 7
+
+DAY_SECONDS = 86400
+
+# Seconds since the epoch of a stored instant, per database
+EPOCH_EXPRESSIONS = {
+    "sqlite": lambda column: cast(func.strftime("%s", column), Integer),
+    "postgresql": lambda column: func.date_part("epoch", column),
+}
+
+# (profile_id, insights) memo, valid while data_version.value is unchanged
+_memo: dict[Optional[int], tuple[int, dict]] = {}
+
+
+async def get_insights(db: AsyncSession, profile_id: Optional[int]) -> dict:
+    """A profile's insights, shaped like the Insights schema."""
+    # Read before querying, so a write committed meanwhile is not masked
+    version = data_version.value
+    memoized = _memo.get(profile_id)
+    if memoized is not None and memoized[0] == version:
+        return memoized[1]
+
+    events = await load_events(db, profile_id)
+    insights = compute_insights(events)
+    _memo[profile_id] = (version, insights)
+    return insights
+
+
+async def load_events(db: AsyncSession, profile_id: Optional[int]) -> np.ndarray:
+    """Feedings and sleeps as an (n, 3) float array of start epoch, duration, is_sleep.
+
+    Rows are in start order; open activities have a duration of NaN.
+    Archived activities are included.
+    """
+    epoch = EPOCH_EXPRESSIONS[db.get_bind().dialect.name]
+
+    def event_rows(model):
+        return select(
+            epoch(model.start_time).label("start_epoch"),
+            func.coalesce(model.duration_seconds, -1),
+            case((model.activity_type == "sleep", 1), else_=0),
+        ).where(model.for_profile(profile_id), model.activity_type.in_(INSIGHT_TYPES))
+
+    if await get_archive_bounds(db, profile_id) is None:
+        query = event_rows(Activity).order_by(Activity.start_time)
+    else:
+        query = union_all(event_rows(Activity), event_rows(ArchivedActivity))
+        query = query.order_by(query.selected_columns.start_epoch)
+    connection = await db.connection()
+    result = await connection.execute(query)
+    # np.array() would probe every Row for array attributes; a flat iterator is read directly
+    events = np.fromiter(chain.from_iterable(result.all()), dtype=np.float64).reshape(-1, 3)
+    events[events[:, 1] < 0, 1] = np.nan
+    return events
+
+
+def utc_offsets(epochs: np.ndarray, tz=LOCAL_TIMEZONE) -> np.ndarray:
+    """UTC offsets of tz, in seconds, at each epoch.
+
+    Offsets are looked up once per UTC day; only rows on days whose offset
+    changes (daylight saving transitions) are looked up one by one.
+    """
+    if not len(epochs):
+        return np.zeros(0)
+    days, inverse = np.unique(epochs // DAY_SECONDS, return_inverse=True)
+    at_start = np.array([_offset(day * DAY_SECONDS, tz) for day in days])
+    at_end = np.array([_offset(day * DAY_SECONDS + DAY_SECONDS - 1, tz) for day in days])
+    offsets = at_start[inverse]
+    changing = (at_start != at_end)[inverse]
+    if changing.any():
+        offsets[changing] = [_offset(epoch, tz) for epoch in epochs[changing]]
+    return offsets
+
+
+def _offset(epoch: float, tz) -> float:
+    return datetime.fromtimestamp(epoch, tz).utcoffset().total_seconds()
+
+
+def interval_stats(seconds: np.ndarray) -> dict:
+    """Count, mean and quartiles of intervals, in minutes."""
+    if not len(seconds):
+        return {"count": 0, "mean_minutes": None, "median_minutes": None,
+                "p25_minutes": None, "p75_minutes": None}
+    p25, median, p75 = np.percentile(seconds, [25, 50, 75]) / 60
+    return {
+        "count": int(len(seconds)),
+        "mean_minutes": round(float(seconds.mean()) / 60, 1),
+        "median_minutes": round(float(median), 1),
+        "p25_minutes": round(float(p25), 1),
+        "p75_minutes": round(float(p75), 1),
+    }
+
+
+def _gaps(ends: np.ndarray, next_starts: np.ndarray) -> np.ndarray:
+    """Mask of gaps from ends to next_starts that count as intervals."""
+    gaps = next_starts - ends
+    return (gaps >= 0) & (gaps <= MAX_INTERVAL_SECONDS)
+
+
+def predict(
+    interval_starts: np.ndarray, intervals: np.ndarray, interval_hours: np.ndarray,
+    last_at: float, last_hour: float
+) -> Optional[dict]:
+    """Expected time of the next event after last_at, or None without enough history."""
+    recent = interval_starts >= last_at - RECENT_DAYS * DAY_SECONDS
+    distance = np.abs(interval_hours - last_hour)
+    same_time = recent & (np.minimum(distance, 24 - distance) <= SAME_TIME_HOURS)
+    samples = intervals[same_time] if same_time.sum() >= MIN_SAME_TIME_SAMPLES else intervals[recent]
+    if len(samples) < 2:
+        return None
+    earliest, expected, latest = np.percentile(samples, [25, 50, 75])
+    return {
+        "expected_at": _instant(last_at + expected),
+        "earliest": _instant(last_at + earliest),
+        "latest": _instant(last_at + latest),
+        "last_at": _instant(last_at),
+        "samples": int(len(samples)),
+    }
+
+
+def _instant(epoch: float) -> datetime:
+    return datetime.fromtimestamp(round(epoch), timezone.utc)
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Mean of each value and the window - 1 values before it (fewer at the start)."""
+    sums = np.cumsum(values)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / counts
+
+
+def compute_insights(events: np.ndarray, tz=LOCAL_TIMEZONE) -> dict:
+    """Patterns and predictions from load_events() rows."""
+    starts, durations, is_sleep = events[:, 0], events[:, 1], events[:, 2] == 1
+    local = starts + utc_offsets(starts, tz)
+    local_days = (local // DAY_SECONDS).astype(np.int64)
+    hours = (local % DAY_SECONDS) / 3600
+    # 1970-01-01 was a Thursday; weekday 0 is Monday as in date.weekday()
+    weekdays = (local_days + 3) % 7
+
+    insights = {
+        "timezone": tz.key,
+        "feeding_intervals": interval_stats(np.zeros(0)),
+        "sleep_durations": interval_stats(np.zeros(0)),
+        "awake_windows": interval_stats(np.zeros(0)),
+        "predictions": {"feeding": None, "sleep": None},
+        "daily": [],
+        "hourly": {},
+        "heatmap": {},
+    }
+
+    for activity_type, mask in (("feeding", ~is_sleep), ("sleep", is_sleep)):
+        hour_bins = hours[mask].astype(np.int64)
+        insights["hourly"][activity_type] = np.bincount(hour_bins, minlength=24).tolist()
+        cells = np.bincount(weekdays[mask] * 24 + hour_bins, minlength=7 * 24)
+        insights["heatmap"][activity_type] = cells.reshape(7, 24).tolist()
+
+    # Feeding to feeding, start to start
+    feed_starts, feed_hours = starts[~is_sleep], hours[~is_sleep]
+    if len(feed_starts):
+        valid = _gaps(feed_starts[:-1], feed_starts[1:])
+        intervals = np.diff(feed_starts)[valid]
+        insights["feeding_intervals"] = interval_stats(intervals)
+        insights["predictions"]["feeding"] = predict(
+            feed_starts[:-1][valid], intervals, feed_hours[:-1][valid], feed_starts[-1], feed_hours[-1]
+        )
+
+    # Awake windows run from the end of one sleep to the start of the next;
+    # no next sleep is predicted while one is in progress
+    sleep_starts, sleep_durations, sleep_hours = starts[is_sleep], durations[is_sleep], hours[is_sleep]
+    completed = ~np.isnan(sleep_durations)
+    insights["sleep_durations"] = interval_stats(sleep_durations[completed])
+    if len(sleep_starts):
+        sleep_ends = sleep_starts + sleep_durations
+        valid = _gaps(sleep_ends[:-1], sleep_starts[1:]) & completed[:-1]
+        windows = (sleep_starts[1:] - sleep_ends[:-1])[valid]
+        end_hours = ((sleep_hours + sleep_durations / 3600) % 24)[:-1][valid]
+        insights["awake_windows"] = interval_stats(windows)
+        if completed[-1]:
+            last_end_hour = (sleep_hours[-1] + sleep_durations[-1] / 3600) % 24
+            insights["predictions"]["sleep"] = predict(
+                sleep_ends[:-1][valid], windows, end_hours, sleep_ends[-1], last_end_hour
+            )
+
+    if len(starts):
+        last_day = local_days.max()
+        first_day = max(local_days.min(), last_day - DAILY_SERIES_DAYS - ROLLING_DAYS + 2)
+        in_range = local_days >= first_day
+        day_index = local_days[in_range] - first_day
+        length = last_day - first_day + 1
+        feedings = np.bincount(day_index[~is_sleep[in_range]], minlength=length)
+        sleep_seconds = np.bincount(
+            day_index[is_sleep[in_range]],
+            weights=np.nan_to_num(durations[in_range][is_sleep[in_range]]),
+            minlength=length,
+        )
+        sleep_hours_per_day = sleep_seconds / 3600
+        feedings_average = _rolling_mean(feedings.astype(np.float64), ROLLING_DAYS)
+        sleep_average = _rolling_mean(sleep_hours_per_day, ROLLING_DAYS)
+        epoch_day = date(1970, 1, 1).toordinal()
+        insights["daily"] = [
+            {
+                "date": date.fromordinal(epoch_day + int(first_day + index)),
+                "feedings": int(feedings[index]),
+                "sleep_hours": round(float(sleep_hours_per_day[index]), 2),
+                "feedings_avg7": round(float(feedings_average[index]), 2),
+                "sleep_hours_avg7": round(float(sleep_average[index]), 2),
+            }
+            for index in range(max(0, length - DAILY_SERIES_DAYS), length)
+        ]
+
+    return insights
@@ -1,24 +1,46 @@
 from fastapi import FastAPI, Request, Depends
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemLoader
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from contextlib import asynccontextmanager
+import time
 from datetime import date, datetime
-from typing import Optional
+from typing import AsyncIterator, Optional
 
+from config import settings
 from database import get_db, init_db
-from models import Activity, BabyProfile
-from routers import activities, profiles
+from analytics import get_analytics_summary
+from timeline import get_timeline_page
+from profile_cache import profile_cache, get_selected_profile, selected_profile_id
+from models import Activity
+from activity_rows import select_activity_rows
+from archive import get_archived_activity, read_activity_rows, tiered_queries
+from changelog import get_sync_version
+from schemas import ProfileResponse
+from routers import activities, profiles, events, sync, insights
+from static_files import CachedStaticFiles, STATIC_DIR, static_url
+from httpcache import page_etag, apply_etag
+from images import photo_variant_url
+from metrics import MetricsMiddleware, metrics, record_render
+from fragments import activity_card
+from write_queue import write_queue
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Initialize database
     await init_db()
+    if settings.write_queue:
+        write_queue.start()
     yield
-    # Shutdown: cleanup if needed
+    # Shutdown: commit writes still queued
+    await write_queue.stop()
+
+
+# Number of most recent activities shown on the dashboard
+DASHBOARD_LIMIT = 50
 
 
 # Helper functions
@@ -30,15 +52,18 @@ def calculate_age_in_weeks(birthday: date) -> int:
     return age_weeks
 
 
-async def get_profile_context(db: AsyncSession) -> dict:
-    """Get profile context for templates including baby info and current role."""
-    # Get current profile
-    profile_result = await db.execute(select(BabyProfile))
-    current_profile = profile_result.scalar_one_or_none()
+async def get_profile_context(db: AsyncSession, current_profile: Optional[ProfileResponse]) -> dict:
+    """Get profile context for templates including baby info and current role.
+
+    Profiles and role come from the in-process profile cache, so warm page
+    views run no queries for the navbar.
+    """
+    profiles = await profile_cache.get_profiles(db)
 
     if not current_profile:
         return {
             "profile": None,
+            "profiles": profiles,
             "baby_age_weeks": None,
             "current_date": date.today(),
             "current_role": None
@@ -47,15 +72,12 @@ async def get_profile_context(db: AsyncSession) -> dict:
     # Calculate age in weeks
     age_weeks = calculate_age_in_weeks(current_profile.birthday)
 
-    # Get most recent activity to determine current role
-    recent_activity_result = await db.execute(
-        select(Activity).order_by(Activity.created_at.desc()).limit(1)
-    )
-    recent_activity = recent_activity_result.scalar_one_or_none()
-    current_role = recent_activity.role if recent_activity and recent_activity.role else "Not set"
+    # Role of the most recently created activity
+    current_role = await profile_cache.get_current_role(db, current_profile.id)
 
     return {
         "profile": current_profile,
+        "profiles": profiles,
         "baby_age_weeks": age_weeks,
         "current_date": date.today(),
         "current_role": current_role
@@ -69,45 +91,113 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+app.add_middleware(MetricsMiddleware)
+
 # Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR), name="static")
+
+# Setup templates; rendered asynchronously so pages can be streamed
+templates = Jinja2Templates(
+    env=Environment(loader=FileSystemLoader("templates"), autoescape=True, enable_async=True)
+)
+templates.env.globals["photo_variant"] = photo_variant_url
+templates.env.globals["static_url"] = static_url
+templates.env.globals["activity_card"] = activity_card
+
+# Characters of rendered HTML collected before they are sent as one chunk
+PAGE_CHUNK_SIZE = 8192
+
+
+def render(request: Request, name: str, context: dict) -> StreamingResponse:
+    """Stream a page template, tagging it with the ETag picked by page_etag.
+
+    The page is rendered while it is sent, PAGE_CHUNK_SIZE characters at a
+    time, so the first bytes leave before the rest of the page is rendered.
+    An error in the middle of a template cuts the response short instead of
+    turning it into a 500.
+    """
+    parts = templates.get_template(name).generate_async({**context, "request": request})
+    response = StreamingResponse(_page_chunks(parts), media_type="text/html")
+    return apply_etag(request, response)
+
+
+async def _page_chunks(parts: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    # Jinja yields every piece of template text and every expression
+    # separately; sending each as its own chunk would cost more than rendering
+    buffer = []
+    size = 0
+    started = time.perf_counter()
+    async for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= PAGE_CHUNK_SIZE:
+            record_render(time.perf_counter() - started)
+            yield "".join(buffer).encode()
+            buffer = []
+            size = 0
+            started = time.perf_counter()
+    record_render(time.perf_counter() - started)
+    if buffer:
+        yield "".join(buffer).encode()
 
-# Setup templates
-templates = Jinja2Templates(directory="templates")
 
 # Include API routers
 app.include_router(activities.router)
 app.include_router(profiles.router)
+app.include_router(events.router)
+app.include_router(sync.router)
+app.include_router(insights.router)
 
 
 # Template routes
 @app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request, db: AsyncSession = Depends(get_db)):
+async def dashboard(
+    request: Request,
+    etag: str = Depends(page_etag),
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
+    db: AsyncSession = Depends(get_db)
+):
     """Display the dashboard with all activities."""
     # Get profile context for navbar
-    profile_context = await get_profile_context(db)
+    profile_context = await get_profile_context(db, profile)
 
-    # Get activities
-    result = await db.execute(
-        select(Activity).order_by(Activity.start_time.desc()).limit(50)
+    # Read before the activities, so catching up from it never misses a change
+    sync_version = await get_sync_version(db)
+
+    # Get activities as plain rows; the template only reads their columns
+    profile_id = selected_profile_id(profile)
+    queries = await tiered_queries(
+        db, profile_id, lambda model: select_activity_rows(model).where(model.for_profile(profile_id))
     )
-    activities_list = result.scalars().all()
+    activities_list = await read_activity_rows(db, queries, DASHBOARD_LIMIT)
 
-    return templates.TemplateResponse(
+    return render(
+        request,
         "dashboard.html",
-        {"request": request, "activities": activities_list, **profile_context}
+        {
+            "activities": activities_list,
+            "dashboard_limit": DASHBOARD_LIMIT,
+            "sync_version": sync_version,
+            **profile_context
+        }
     )
 
 
 @app.get("/add", response_class=HTMLResponse)
-async def add_activity_form(request: Request, db: AsyncSession = Depends(get_db)):
+async def add_activity_form(
+    request: Request,
+    etag: str = Depends(page_etag),
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
+    db: AsyncSession = Depends(get_db)
+):
     """Display form to add a new activity."""
     # Get profile context for navbar
-    profile_context = await get_profile_context(db)
+    profile_context = await get_profile_context(db, profile)
 
-    return templates.TemplateResponse(
+    return render(
+        request,
         "activity_form.html",
-        {"request": request, "activity": None, **profile_context}
+        {"activity": None, **profile_context}
     )
 
 
@@ -115,68 +205,87 @@ async def add_activity_form(request: Request, db: AsyncSession = Depends(get_db)
 async def edit_activity_form(
     request: Request,
     activity_id: int,
+    etag: str = Depends(page_etag),
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
     db: AsyncSession = Depends(get_db)
 ):
     """Display form to edit an existing activity."""
     # Get profile context for navbar
-    profile_context = await get_profile_context(db)
+    profile_context = await get_profile_context(db, profile)
 
     result = await db.execute(
         select(Activity).where(Activity.id == activity_id)
     )
-    activity = result.scalar_one_or_none()
+    activity = result.scalar_one_or_none() or await get_archived_activity(db, activity_id)
 
-    return templates.TemplateResponse(
+    return render(
+        request,
         "activity_form.html",
-        {"request": request, "activity": activity, **profile_context}
+        {"activity": activity, **profile_context}
     )
 
 
 @app.get("/settings", response_class=HTMLResponse)
-async def settings_page(request: Request, db: AsyncSession = Depends(get_db)):
+async def settings_page(
+    request: Request,
+    etag: str = Depends(page_etag),
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
+    db: AsyncSession = Depends(get_db)
+):
     """Display the settings page."""
     # Get profile context for navbar
-    profile_context = await get_profile_context(db)
+    profile_context = await get_profile_context(db, profile)
 
-    return templates.TemplateResponse(
+    return render(
+        request,
         "settings.html",
-        {"request": request, **profile_context}
+        profile_context
     )
 
 
 @app.get("/analytics", response_class=HTMLResponse)
-async def analytics_page(request: Request, db: AsyncSession = Depends(get_db)):
+async def analytics_page(
+    request: Request,
+    etag: str = Depends(page_etag),
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
+    db: AsyncSession = Depends(get_db)
+):
     """Display the analytics page with activity insights."""
     # Get profile context for navbar
-    profile_context = await get_profile_context(db)
+    profile_context = await get_profile_context(db, profile)
 
-    # Get all activities ordered by start time
-    result = await db.execute(
-        select(Activity).order_by(Activity.start_time.desc())
-    )
-    activities_list = result.scalars().all()
+    # Aggregate activity statistics in the database
+    summary = await get_analytics_summary(db, selected_profile_id(profile))
 
-    return templates.TemplateResponse(
+    return render(
+        request,
         "analytics.html",
-        {"request": request, "activities": activities_list, **profile_context}
+        {"summary": summary, **profile_context}
     )
 
 
 @app.get("/timeline", response_class=HTMLResponse)
-async def timeline_page(request: Request, db: AsyncSession = Depends(get_db)):
+async def timeline_page(
+    request: Request,
+    before: Optional[date] = None,
+    etag: str = Depends(page_etag),
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
+    db: AsyncSession = Depends(get_db)
+):
     """Display the timeline page with chronological activity view."""
     # Get profile context for navbar
-    profile_context = await get_profile_context(db)
+    profile_context = await get_profile_context(db, profile)
 
-    # Get all activities ordered by start time (newest first)
-    result = await db.execute(
-        select(Activity).order_by(Activity.start_time.desc())
-    )
-    activities_list = result.scalars().all()
+    # Read before the activities, so catching up from it never misses a change
+    sync_version = await get_sync_version(db)
+
+    # Get the latest days of activities (older days are loaded on demand)
+    timeline = await get_timeline_page(db, selected_profile_id(profile), before=before)
 
-    return templates.TemplateResponse(
+    return render(
+        request,
         "timeline.html",
-        {"request": request, "activities": activities_list, **profile_context}
+        {"timeline": timeline, "sync_version": sync_version, **profile_context}
     )
 
 
@@ -186,6 +295,12 @@ def health_check():
     return {"status": "healthy", "message": "Baby Activity Tracker is running"}
 
 
+# Prometheus scrape endpoint
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 # if __name__ == "__main__":
 #     import uvicorn
 #     uvicorn.run(app, host="0.0.0.0", port=7999)
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""Request timing, query counting and slow-query logging.
+
+MetricsMiddleware times every request and, through a context variable,
+collects the SQL statements it runs (via cursor events on the engine) and
+the time spent rendering templates (reported by main.render). Totals are
+aggregated per route and exposed in the Prometheus text format by
+``GET /api/metrics``. Statements slower than SLOW_QUERY_MS are logged with
+their parameters.
+
+Like the profile cache, the aggregates live in process memory, so each
+application process reports its own numbers.
+"""
+import logging
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from config import settings
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds (seconds) of the write queue's commit latency histogram buckets
+COMMIT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Longest statement or parameter text written to the slow-query log
+SLOW_QUERY_LOG_CHARS = 2000
+
+
+class RequestStats:
+    """Database and template work done while handling one request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+
+
+class RouteMetrics:
+    """Aggregates for one (method, route) pair."""
+
+    def __init__(self):
+        self.statuses = defaultdict(int)
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+
+    def observe(self, status: int, seconds: float, stats: RequestStats):
+        self.statuses[status] += 1
+        self.count += 1
+        self.seconds += seconds
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+        self.queries += stats.queries
+        self.db_seconds += stats.db_seconds
+        self.render_seconds += stats.render_seconds
+
+
+class Metrics:
+    """Process-wide request and query aggregates."""
+
+    def __init__(self):
+        self.routes = defaultdict(RouteMetrics)
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+        self.write_batches = 0
+        self.write_batch_writes = 0
+        self.write_wait_seconds = 0.0
+        self.write_batch_seconds = 0.0
+        self.write_commit_seconds = 0.0
+        self.write_commit_buckets = [0] * len(COMMIT_LATENCY_BUCKETS)
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        self.routes[(method, route)].observe(status, seconds, stats)
+
+    def observe_query(self, seconds: float):
+        self.queries += 1
+        self.db_seconds += seconds
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+
+    def observe_write_batch(self, writes: int, wait_seconds: float, batch_seconds: float, commit_seconds: float):
+        """Record a write queue transaction (see write_queue.py)."""
+        self.write_batches += 1
+        self.write_batch_writes += writes
+        self.write_wait_seconds += wait_seconds
+        self.write_batch_seconds += batch_seconds
+        self.write_commit_seconds += commit_seconds
+        for index, bound in enumerate(COMMIT_LATENCY_BUCKETS):
+            if commit_seconds <= bound:
+                self.write_commit_buckets[index] += 1
+
+    def observe_fragment(self, hit: bool):
+        """Record a lookup in the activity card cache (see fragments.py)."""
+        if hit:
+            self.fragment_hits += 1
+        else:
+            self.fragment_misses += 1
+
+    def render_prometheus(self) -> str:
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        metric("http_requests_total", "counter", "HTTP requests by route and status code.")
+        for (method, route), route_metrics in sorted(self.routes.items()):
+            for status, count in sorted(route_metrics.statuses.items()):
+                lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+        metric("http_request_duration_seconds", "histogram", "Time to handle a request.")
+        for (method, route), route_metrics in sorted(self.routes.items()):
+            for bound, count in zip(LATENCY_BUCKETS, route_metrics.buckets):
+                labels = _labels(method=method, route=route, le=bound)
+                lines.append(f"http_request_duration_seconds_bucket{labels} {count}")
+            labels = _labels(method=method, route=route, le="+Inf")
+            lines.append(f"http_request_duration_seconds_bucket{labels} {route_metrics.count}")
+            labels = _labels(method=method, route=route)
+            lines.append(f"http_request_duration_seconds_sum{labels} {route_metrics.seconds:.6f}")
+            lines.append(f"http_request_duration_seconds_count{labels} {route_metrics.count}")
+
+        for name, attribute, help_text in (
+            ("http_request_db_queries_total", "queries", "SQL statements executed while handling requests."),
+            ("http_request_db_seconds_total", "db_seconds", "Time spent in SQL statements while handling requests."),
+            ("http_request_render_seconds_total", "render_seconds", "Time spent rendering templates."),
+        ):
+            metric(name, "counter", help_text)
+            for (method, route), route_metrics in sorted(self.routes.items()):
+                value = getattr(route_metrics, attribute)
+                lines.append(f"{name}{_labels(method=method, route=route)} {value:g}")
+
+        metric("db_queries_total", "counter", "SQL statements executed.")
+        lines.append(f"db_queries_total {self.queries}")
+        metric("db_query_seconds_total", "counter", "Time spent in SQL statements.")
+        lines.append(f"db_query_seconds_total {self.db_seconds:.6f}")
+        metric("db_slow_queries_total", "counter", f"SQL statements slower than {settings.slow_query_ms} ms.")
+        lines.append(f"db_slow_queries_total {self.slow_queries}")
+
+        metric("write_queue_batches_total", "counter", "Transactions committed by the write queue.")
+        lines.append(f"write_queue_batches_total {self.write_batches}")
+        metric("write_queue_writes_total", "counter", "Writes run in write queue transactions.")
+        lines.append(f"write_queue_writes_total {self.write_batch_writes}")
+        metric("write_queue_wait_seconds_total", "counter", "Time writes spent queued before their transaction began.")
+        lines.append(f"write_queue_wait_seconds_total {self.write_wait_seconds:.6f}")
+        metric("write_queue_batch_seconds_total", "counter", "Time spent in write queue transactions, commit included.")
+        lines.append(f"write_queue_batch_seconds_total {self.write_batch_seconds:.6f}")
+        metric("write_queue_commit_seconds", "histogram", "Time to commit a write queue transaction.")
+        for bound, count in zip(COMMIT_LATENCY_BUCKETS, self.write_commit_buckets):
+            lines.append(f"write_queue_commit_seconds_bucket{_labels(le=bound)} {count}")
+        lines.append(f'write_queue_commit_seconds_bucket{_labels(le="+Inf")} {self.write_batches}')
+        lines.append(f"write_queue_commit_seconds_sum {self.write_commit_seconds:.6f}")
+        lines.append(f"write_queue_commit_seconds_count {self.write_batches}")
+
+        metric("fragment_cache_hits_total", "counter", "Activity cards served from the fragment cache.")
+        lines.append(f"fragment_cache_hits_total {self.fragment_hits}")
+        metric("fragment_cache_misses_total", "counter", "Activity cards rendered because they were not cached.")
+        lines.append(f"fragment_cache_misses_total {self.fragment_misses}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(**labels) -> str:
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+metrics = Metrics()
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def record_render(seconds: float):
+    """Add template render time to the current request."""
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.render_seconds += seconds
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_start"].pop()
+    metrics.observe_query(seconds)
+    if seconds * 1000 >= settings.slow_query_ms:
+        metrics.slow_queries += 1
+        logger.warning(
+            "Slow query (%.1f ms): %s; parameters: %s",
+            seconds * 1000,
+            statement[:SLOW_QUERY_LOG_CHARS],
+            repr(parameters)[:SLOW_QUERY_LOG_CHARS],
+        )
+
+
+def _route_label(scope) -> str:
+    """Path template of the route that handled a request."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Mounted apps (static files) only extend root_path with their prefix
+    return scope.get("root_path") or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, queries and render time per route.
+
+    Requests are labelled with the route's path template (for example
+    ``/api/activities/{activity_id}``) so the number of series stays small.
+    The body of streaming responses is included in the measurement.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            seconds = time.perf_counter() - started
+            _request_stats.reset(token)
+            route_path = _route_label(scope)
+            metrics.observe_request(scope["method"], route_path, status, seconds, stats)
+            logger.debug(
+                "%s %s %d in %.1f ms: %d queries, %.1f ms db, %.1f ms render",
+                scope["method"], route_path, status, seconds * 1000,
+                stats.queries, stats.db_seconds * 1000, stats.render_seconds * 1000,
+            )
@@ -0,0 +1,153 @@
+"""Schema migrations.
+
+The schema is managed with Alembic (revisions in alembic/versions). init_db()
+calls upgrade() on startup, which only reads the alembic_version table when
+no revision is pending. Schema changes go into a new revision, numbered
+after the last one in alembic/versions:
+
+    alembic revision --rev-id NNNN -m "add something"
+    alembic upgrade head
+
+SQLite databases created before Alembic tracked their migrations in the
+``user_version`` pragma with the functions below. upgrade() first applies
+the ones such a database is missing, which brings it to the schema of the
+baseline revision, and stamps it with that revision. LEGACY_MIGRATIONS is
+frozen; do not add to it.
+"""
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import Connection, inspect
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+# Revision whose schema matches the last legacy migration
+BASELINE_REVISION = "0001"
+
+
+def add_activity_indexes(connection: Connection):
+    """Index activities for filtered listing and start_time ordering."""
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_activities_profile_type_start "
+        "ON activities (profile_id, activity_type, start_time)"
+    )
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_activities_start_time "
+        "ON activities (start_time)"
+    )
+
+
+def backfill_daily_activity_stats(connection: Connection):
+    """Fill the daily_activity_stats rollups for existing activities."""
+    from models import Activity
+    from rollups import rebuild
+
+    rebuild(connection, models=(Activity,))
+
+
+def scope_activities_by_profile(connection: Connection):
+    """Index activities per profile and attach profile-less activities to the only profile."""
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_activities_profile_start "
+        "ON activities (profile_id, start_time)"
+    )
+    updated = connection.exec_driver_sql(
+        "UPDATE activities SET profile_id = (SELECT MIN(id) FROM baby_profiles) "
+        "WHERE profile_id IS NULL AND (SELECT COUNT(*) FROM baby_profiles) = 1"
+    )
+    if updated.rowcount:
+        from models import Activity
+        from rollups import rebuild
+
+        rebuild(connection, models=(Activity,))
+
+
+def add_activity_auto_closed(connection: Connection):
+    """Flag activities whose end_time was set by the next activity of their profile.
+
+    Earlier versions always ended an open activity at the start of the next
+    one, so an end_time equal to the next start is taken as automatic.
+    """
+    connection.exec_driver_sql(
+        "ALTER TABLE activities ADD COLUMN auto_closed BOOLEAN NOT NULL DEFAULT 0"
+    )
+    connection.exec_driver_sql(
+        "UPDATE activities SET auto_closed = 1 "
+        "WHERE end_time IS NOT NULL AND end_time = ("
+        "SELECT MIN(next.start_time) FROM activities AS next "
+        "WHERE next.profile_id IS activities.profile_id AND next.start_time > activities.start_time)"
+    )
+
+
+def add_activity_derived_fields(connection: Connection):
+    """Store each activity's duration and local day (see models.derived_fields)."""
+    from models import Activity
+    from rollups import refresh_derived_fields
+
+    connection.exec_driver_sql("ALTER TABLE activities ADD COLUMN duration_seconds INTEGER")
+    connection.exec_driver_sql("ALTER TABLE activities ADD COLUMN local_day DATE")
+    refresh_derived_fields(connection, models=(Activity,))
+
+
+def add_activity_sync(connection: Connection):
+    """Add idempotency keys and log every existing activity as changed.
+
+    create_all has already created the empty activity_changes table; seeding
+    it lets the first sync (since=0) return the whole history.
+    """
+    connection.exec_driver_sql("ALTER TABLE activities ADD COLUMN idempotency_key VARCHAR")
+    connection.exec_driver_sql(
+        "CREATE UNIQUE INDEX ix_activities_idempotency_key ON activities (idempotency_key)"
+    )
+    connection.exec_driver_sql(
+        "INSERT INTO activity_changes (activity_id, profile_id) "
+        "SELECT id, profile_id FROM activities ORDER BY id"
+    )
+
+
+# Pre-Alembic migrations, in the order they were applied
+LEGACY_MIGRATIONS = [
+    add_activity_indexes,
+    backfill_daily_activity_stats,
+    scope_activities_by_profile,
+    add_activity_auto_closed,
+    add_activity_derived_fields,
+    add_activity_sync,
+]
+
+
+def upgrade_legacy(connection: Connection):
+    """Apply the pre-Alembic migrations a SQLite database is missing."""
+    from models import ActivityChange, DailyActivityStats
+
+    # These tables were created by create_all before the migrations ran
+    DailyActivityStats.__table__.create(connection, checkfirst=True)
+    ActivityChange.__table__.create(connection, checkfirst=True)
+
+    version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+    for migration in LEGACY_MIGRATIONS[version:]:
+        migration(connection)
+    connection.exec_driver_sql(f"PRAGMA user_version = {len(LEGACY_MIGRATIONS)}")
+
+
+def alembic_config(connection: Connection = None) -> Config:
+    """Alembic configuration, optionally bound to an open connection."""
+    config = Config(ALEMBIC_INI)
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def upgrade(connection: Connection):
+    """Bring the database to the latest Alembic revision."""
+    config = alembic_config(connection)
+    inspector = inspect(connection)
+    if (
+        connection.dialect.name == "sqlite"
+        and inspector.has_table("activities")
+        and not inspector.has_table("alembic_version")
+    ):
+        upgrade_legacy(connection)
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, "head")
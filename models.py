@@ -1,15 +1,43 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Enum, TypeDecorator, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, DateTime, Text, Enum, TypeDecorator, ForeignKey, Date, Index, Boolean, event
 from sqlalchemy.orm import relationship
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo
 import enum
+from config import settings
 from database import Base
 
+# Timezone that defines an activity's local calendar day
+LOCAL_TIMEZONE = ZoneInfo(settings.tracker_timezone)
+
+
+def local_day(moment: datetime) -> date:
+    """The local calendar day of a UTC timestamp."""
+    return moment.astimezone(LOCAL_TIMEZONE).date()
+
+
+def derived_fields(start_time: datetime, end_time: Optional[datetime]) -> dict:
+    """Values of the activity columns computed from its start and end."""
+    return {
+        "duration_seconds": int((end_time - start_time).total_seconds()) if end_time else None,
+        "local_day": local_day(start_time),
+    }
+
 
 class TZDateTime(TypeDecorator):
-    """A DateTime type that ensures timezone awareness."""
+    """A DateTime type that ensures timezone awareness.
+
+    Backends with a native timezone-aware type (PostgreSQL's timestamptz)
+    store the instant directly; on SQLite it is stored as naive UTC.
+    """
     impl = DateTime
     cache_ok = True
 
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(DateTime(timezone=True))
+        return dialect.type_descriptor(DateTime())
+
     def process_bind_param(self, value, dialect):
         """Convert timezone-aware datetime to UTC before storing."""
         if value is not None:
@@ -19,6 +47,8 @@ class TZDateTime(TypeDecorator):
             else:
                 # Convert to UTC
                 value = value.astimezone(timezone.utc)
+            if dialect.name == "postgresql":
+                return value
             # Store as timezone-naive UTC (SQLite doesn't support timezones)
             return value.replace(tzinfo=None)
         return value
@@ -29,6 +59,9 @@ class TZDateTime(TypeDecorator):
             # SQLite stores as naive datetime, so add UTC timezone
             if value.tzinfo is None:
                 value = value.replace(tzinfo=timezone.utc)
+            elif value.tzinfo is not timezone.utc:
+                # timestamptz comes back in the session's time zone
+                value = value.astimezone(timezone.utc)
         return value
 
 
@@ -36,6 +69,7 @@ class ActivityType(str, enum.Enum):
     SLEEP = "sleep"
     FEEDING = "feeding"
     DIAPER = "diaper"
+    PLAY = "play"
 
 
 class Role(str, enum.Enum):
@@ -69,13 +103,156 @@ class Activity(Base):
     activity_type = Column(String, nullable=False)
     start_time = Column(TZDateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
     end_time = Column(TZDateTime, nullable=True)
+    # True when end_time was set by a later activity (see autoclose.py)
+    auto_closed = Column(Boolean, nullable=False, default=False, server_default="0")
+    # Derived from start_time and end_time on every write (see derived_fields)
+    duration_seconds = Column(Integer, nullable=True)
+    local_day = Column(Date, nullable=True)
     notes = Column(Text, nullable=True)
     role = Column(String, nullable=True)  # Who performed this activity
     profile_id = Column(Integer, ForeignKey("baby_profiles.id", ondelete="CASCADE"), nullable=True)
     created_at = Column(TZDateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    # Client-generated Idempotency-Key of the request that created it
+    idempotency_key = Column(String, nullable=True)
 
     # Relationship to profile
     profile = relationship("BabyProfile", back_populates="activities")
 
+    __table_args__ = (
+        Index("ix_activities_profile_start", "profile_id", "start_time"),
+        Index("ix_activities_profile_type_start", "profile_id", "activity_type", "start_time"),
+        Index("ix_activities_start_time", "start_time"),
+        Index("ix_activities_idempotency_key", "idempotency_key", unique=True),
+    )
+
+    @classmethod
+    def for_profile(cls, profile_id):
+        """Filter clause for the activities of a profile (None: activities without one)."""
+        if profile_id is None:
+            return cls.profile_id.is_(None)
+        return cls.profile_id == profile_id
+
     def __repr__(self):
         return f"<Activity(id={self.id}, type={self.activity_type}, start={self.start_time}, role={self.role})>"
+
+
+@event.listens_for(Activity, "before_insert")
+@event.listens_for(Activity, "before_update")
+def _set_derived_fields(mapper, connection, activity):
+    """Keep duration_seconds and local_day in sync for ORM writes.
+
+    Bulk statements (insert(Activity) with a list of rows) bypass mapper
+    events and pass derived_fields() themselves.
+    """
+    for key, value in derived_fields(activity.start_time, activity.end_time).items():
+        setattr(activity, key, value)
+
+
+class ArchivedActivity(Base):
+    """A completed activity moved out of the activities table by archive.py.
+
+    Same columns as Activity, minus the idempotency key, and the same id.
+    Rows are only ever inserted or deleted, in batches; an archived activity
+    that is edited, or that a write next to it could end, is moved back.
+    """
+    __tablename__ = "activities_archive"
+
+    # The id it had (and gets back) in activities
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    activity_type = Column(String, nullable=False)
+    start_time = Column(TZDateTime, nullable=False)
+    end_time = Column(TZDateTime, nullable=False)
+    auto_closed = Column(Boolean, nullable=False)
+    duration_seconds = Column(Integer, nullable=True)
+    local_day = Column(Date, nullable=True)
+    notes = Column(Text, nullable=True)
+    role = Column(String, nullable=True)
+    profile_id = Column(Integer, ForeignKey("baby_profiles.id", ondelete="CASCADE"), nullable=True)
+    created_at = Column(TZDateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_activities_archive_profile_start", "profile_id", "start_time"),
+    )
+
+    @classmethod
+    def for_profile(cls, profile_id):
+        """Filter clause for the archived activities of a profile (None: those without one)."""
+        if profile_id is None:
+            return cls.profile_id.is_(None)
+        return cls.profile_id == profile_id
+
+    def __repr__(self):
+        return f"<ArchivedActivity(id={self.id}, type={self.activity_type}, start={self.start_time})>"
+
+
+class ArchiveMonth(Base):
+    """Summary of a profile's archived activities of one local month, type and role.
+
+    Kept in step with activities_archive by archive.py. Reads check the
+    latest archived start and end here to decide whether a range reaches
+    into the archive at all. Activities without a profile are stored under
+    profile_id 0, and those without a role under role "".
+    """
+    __tablename__ = "archive_months"
+
+    profile_id = Column(Integer, primary_key=True, default=0)
+    month = Column(Date, primary_key=True)
+    activity_type = Column(String, primary_key=True)
+    role = Column(String, primary_key=True, default="")
+    count = Column(Integer, nullable=False)
+    total_duration_seconds = Column(Integer, nullable=False)
+    first_start = Column(TZDateTime, nullable=False)
+    last_start = Column(TZDateTime, nullable=False)
+    last_end = Column(TZDateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<ArchiveMonth(profile_id={self.profile_id}, month={self.month}, type={self.activity_type}, count={self.count})>"
+
+
+class ActivityChange(Base):
+    """Change log read by GET /api/sync, appended to by every activity write.
+
+    Each row records that an activity of a profile changed; whether it was
+    created, updated or deleted is read from the activities table when the
+    log is synced. Moving an activity to another profile records it under
+    both. AUTOINCREMENT keeps seq from reusing the numbers of deleted rows.
+    """
+    __tablename__ = "activity_changes"
+
+    seq = Column(Integer, primary_key=True)
+    activity_id = Column(Integer, nullable=False)
+    profile_id = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index("ix_activity_changes_profile_seq", "profile_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
+    @classmethod
+    def for_profile(cls, profile_id):
+        """Filter clause for the changes of a profile (None: activities without one)."""
+        if profile_id is None:
+            return cls.profile_id.is_(None)
+        return cls.profile_id == profile_id
+
+    def __repr__(self):
+        return f"<ActivityChange(seq={self.seq}, activity_id={self.activity_id}, profile_id={self.profile_id})>"
+
+
+class DailyActivityStats(Base):
+    """Per-day activity totals, maintained incrementally by the activity write routes.
+
+    Each activity counts towards the local day (see TRACKER_TIMEZONE) on which
+    it started. Activities without a profile are stored under profile_id 0.
+    """
+    __tablename__ = "daily_activity_stats"
+
+    profile_id = Column(Integer, primary_key=True, default=0)
+    day = Column(Date, primary_key=True)
+    activity_type = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    completed_count = Column(Integer, nullable=False, default=0)
+    total_duration_seconds = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DailyActivityStats(profile_id={self.profile_id}, day={self.day}, type={self.activity_type}, count={self.count})>"
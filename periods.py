@@ -0,0 +1,172 @@
+"""Activity totals bucketed by local day, week or month in any timezone.
+
+Bucket boundaries are local midnights in the requested IANA timezone,
+converted to UTC with zoneinfo, so a day that changes to or from daylight
+saving time covers 23 or 25 hours. The boundaries are sent as a small
+``buckets`` CTE and joined to activities on start_time: counts and durations
+are summed in SQL, and each bucket is a range read of the
+(profile_id, start_time) index. Activities count towards the bucket in which
+they start, like the daily rollups. Archived activities are totalled the
+same way, from their own table, when the range reaches back to them.
+
+Weeks start on Monday (ISO weeks).
+"""
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import Integer, and_, func, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from activity_rows import activity_dicts, select_activity_rows
+from archive import get_archive_bounds, tiered_queries
+from models import Activity, ArchivedActivity, TZDateTime
+
+PERIODS = ("day", "week", "month")
+
+# Most buckets a single request may ask for; each is one term of a UNION ALL,
+# and SQLite allows at most 500 terms in a compound SELECT
+MAX_PERIOD_BUCKETS = 366
+
+
+class PeriodError(ValueError):
+    pass
+
+
+def get_timezone(name: str) -> ZoneInfo:
+    """Look up an IANA timezone name such as ``Europe/Berlin``."""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise PeriodError(f"Unknown timezone: {name}")
+
+
+def period_start(day: date, period: str) -> date:
+    """First local day of the period containing day."""
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _shift(start: date, period: str, steps: int) -> date:
+    """First day of the period steps periods after (negative: before) start."""
+    if period == "week":
+        return start + timedelta(weeks=steps)
+    if period == "month":
+        month = start.year * 12 + start.month - 1 + steps
+        return date(month // 12, month % 12 + 1, 1)
+    return start + timedelta(days=steps)
+
+
+def bucket_bounds(period: str, tz: ZoneInfo, end: date, count: int) -> list[tuple[date, datetime]]:
+    """Boundaries of count periods ending with the one that contains end.
+
+    Returns count + 1 (local first day, UTC instant) pairs, oldest first;
+    bucket i runs from boundary i up to, not including, boundary i + 1.
+    """
+    if period not in PERIODS:
+        raise PeriodError(f"Unsupported period: {period}")
+    try:
+        last = period_start(end, period)
+        days = [_shift(last, period, step) for step in range(1 - count, 2)]
+        return [
+            (day, datetime.combine(day, time.min, tzinfo=tz).astimezone(timezone.utc))
+            for day in days
+        ]
+    except (OverflowError, ValueError):
+        raise PeriodError("Period range is out of bounds")
+
+
+async def get_period_summary(
+    db: AsyncSession,
+    profile_id: Optional[int],
+    period: str,
+    tz: ZoneInfo,
+    end: date,
+    count: int,
+    include_activities: bool = False,
+) -> dict:
+    """Per-type totals of a profile's activities in consecutive local periods.
+
+    The result is shaped like PeriodSummary, oldest bucket first, and ready
+    for ORJSONResponse. Empty buckets are included. With include_activities
+    each bucket also lists its activities in start_time order.
+    """
+    bounds = bucket_bounds(period, tz, end, count)
+    edges = [moment for _, moment in bounds]
+
+    buckets = union_all(*(
+        select(
+            literal(index, Integer).label("bucket"),
+            literal(edges[index], TZDateTime).label("bucket_start"),
+            literal(edges[index + 1], TZDateTime).label("bucket_end"),
+        )
+        for index in range(count)
+    )).cte("buckets")
+
+    # Archived activities are only read when the range reaches back to them
+    archive = await get_archive_bounds(db, profile_id)
+    models = [Activity]
+    if archive is not None and edges[0] <= archive.last_start:
+        models.append(ArchivedActivity)
+
+    totals = []
+    for model in models:
+        result = await db.execute(
+            select(
+                buckets.c.bucket,
+                model.activity_type,
+                func.count(model.id),
+                func.count(model.end_time),
+                func.coalesce(func.sum(model.duration_seconds), 0),
+            )
+            .select_from(buckets)
+            .join(model, and_(
+                model.for_profile(profile_id),
+                model.start_time >= buckets.c.bucket_start,
+                model.start_time < buckets.c.bucket_end,
+            ))
+            .group_by(buckets.c.bucket, model.activity_type)
+        )
+        totals.extend(result.all())
+
+    summaries = []
+    for index in range(count):
+        summary = {
+            "start": bounds[index][0],
+            "end": bounds[index + 1][0],
+            "start_time": edges[index],
+            "end_time": edges[index + 1],
+            "total": 0,
+            "by_type": {},
+        }
+        if include_activities:
+            summary["activities"] = []
+        summaries.append(summary)
+
+    for index, activity_type, type_count, completed, total_seconds in totals:
+        summary = summaries[index]
+        summary["total"] += type_count
+        by_type = summary["by_type"].setdefault(
+            activity_type, {"count": 0, "completed": 0, "total_seconds": 0.0}
+        )
+        by_type["count"] += type_count
+        by_type["completed"] += completed
+        by_type["total_seconds"] += float(total_seconds)
+
+    if include_activities:
+        def bucket_rows(model):
+            return select_activity_rows(model).where(
+                model.for_profile(profile_id),
+                model.start_time >= edges[0],
+                model.start_time < edges[-1],
+            )
+
+        for query in await tiered_queries(db, profile_id, bucket_rows, descending=False):
+            for activity in activity_dicts(await db.execute(query)):
+                summaries[bisect_right(edges, activity["start_time"]) - 1]["activities"].append(activity)
+
+    return {"period": period, "timezone": tz.key, "buckets": summaries}
@@ -0,0 +1,134 @@
+from fastapi import Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Optional
+
+from database import get_db
+from models import Activity, ArchivedActivity, BabyProfile
+from schemas import ProfileResponse
+
+# Shown in the navbar when no activity has a role yet
+DEFAULT_ROLE = "Not set"
+
+# Cookie holding the profile selected on this device
+PROFILE_COOKIE = "profile_id"
+
+_MISSING = object()
+
+
+class ProfileContextCache:
+    """In-process cache of the profile data shown on every page.
+
+    Holds all baby profiles and, per profile, the current caregiver role (the
+    role of the profile's most recently created activity). Write routes call
+    invalidate_profile() or invalidate_role() after committing; the next page
+    view reloads the invalidated value once and every later view is served
+    without queries.
+    """
+
+    def __init__(self):
+        self._profiles = _MISSING
+        self._roles: dict[Optional[int], str] = {}
+        # Bumped on every invalidation so a load that raced with a write
+        # does not store a stale value
+        self._profile_generation = 0
+        self._role_generation = 0
+
+    async def get_profiles(self, db: AsyncSession) -> list[ProfileResponse]:
+        """All profiles, oldest first."""
+        if self._profiles is _MISSING:
+            generation = self._profile_generation
+            result = await db.execute(select(BabyProfile).order_by(BabyProfile.id))
+            value = [ProfileResponse.model_validate(profile) for profile in result.scalars()]
+            if generation != self._profile_generation:
+                return value
+            self._profiles = value
+        return self._profiles
+
+    async def get_profile(self, db: AsyncSession, profile_id: int) -> Optional[ProfileResponse]:
+        for profile in await self.get_profiles(db):
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    async def resolve(self, db: AsyncSession, profile_id: Optional[int]) -> Optional[ProfileResponse]:
+        """The requested profile if it exists, otherwise the first profile."""
+        profiles = await self.get_profiles(db)
+        for profile in profiles:
+            if profile.id == profile_id:
+                return profile
+        return profiles[0] if profiles else None
+
+    async def get_current_role(self, db: AsyncSession, profile_id: Optional[int]) -> str:
+        if profile_id not in self._roles:
+            generation = self._role_generation
+            value = None
+            # Archived activities only matter when every activity is archived
+            for model in (Activity, ArchivedActivity):
+                result = await db.execute(
+                    select(model.role)
+                    .where(model.for_profile(profile_id))
+                    .order_by(model.created_at.desc())
+                    .limit(1)
+                )
+                row = result.first()
+                if row is not None:
+                    value = row.role
+                    break
+            value = value or DEFAULT_ROLE
+            if generation != self._role_generation:
+                return value
+            self._roles[profile_id] = value
+        return self._roles[profile_id]
+
+    def invalidate_profile(self):
+        """Drop the cached profiles after one was created, updated or deleted."""
+        self._profiles = _MISSING
+        self._profile_generation += 1
+
+    def invalidate_role(self, profile_id: Optional[int] = _MISSING):
+        """Drop the cached current role of a profile, or of all profiles."""
+        if profile_id is _MISSING:
+            self._roles.clear()
+        else:
+            self._roles.pop(profile_id, None)
+        self._role_generation += 1
+
+    def invalidate(self):
+        self.invalidate_profile()
+        self.invalidate_role()
+
+
+profile_cache = ProfileContextCache()
+
+
+def requested_profile_id(request: Request) -> Optional[int]:
+    """Profile id asked for by the profile_id query parameter or the selection cookie."""
+    value = request.query_params.get(PROFILE_COOKIE) or request.cookies.get(PROFILE_COOKIE)
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+async def get_selected_profile(
+    request: Request,
+    profile_id: Optional[int] = Query(None, description="Profile to use; defaults to the selected profile"),
+    db: AsyncSession = Depends(get_db)
+) -> Optional[ProfileResponse]:
+    """Dependency resolving the profile a request is scoped to.
+
+    An explicit profile_id query parameter must exist. Otherwise the profile
+    selected on this device (cookie) is used, falling back to the first
+    profile. None means there are no profiles yet.
+    """
+    if profile_id is not None:
+        profile = await profile_cache.get_profile(db, profile_id)
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return profile
+    return await profile_cache.resolve(db, requested_profile_id(request))
+
+
+def selected_profile_id(profile: Optional[ProfileResponse]) -> Optional[int]:
+    return profile.id if profile else None
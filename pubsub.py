@@ -0,0 +1,53 @@
+import asyncio
+import json
+from typing import Optional
+
+# Events buffered per subscriber before it is considered too slow and
+# told to resynchronize
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Sentinel queued to a subscriber that fell behind
+RESYNC = ("resync", {})
+
+
+class EventBus:
+    """In-process publish/subscribe bus for live page updates.
+
+    Write routes publish small JSON events after committing; every
+    connected /api/events stream gets its own bounded queue, so publishing
+    costs O(1) per subscriber and never waits on a slow client.
+    """
+
+    def __init__(self):
+        self._subscribers: set[asyncio.Queue] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: str, data: Optional[dict] = None):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait((event, data or {}))
+            except asyncio.QueueFull:
+                # Drop the backlog and ask the client to reload instead
+                self.unsubscribe(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Serialize one event in the text/event-stream wire format."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+event_bus = EventBus()
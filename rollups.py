@@ -0,0 +1,206 @@
+"""Incrementally maintained daily activity statistics.
+
+The daily_activity_stats table holds one row per (profile, local day,
+activity type) with the number of activities, how many of them are completed
+and their total duration. Write routes describe each change as a pair of
+activity snapshots (before, after) and apply_changes() adds the difference to
+the affected rows, so summaries over weeks or months read a few hundred
+rollup rows instead of every activity.
+
+Run ``python rollups.py rebuild`` to recompute the table from scratch, for
+example after changing TRACKER_TIMEZONE.
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from datetime import date
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import Connection, bindparam, select, delete, func, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Activity, ArchivedActivity, DailyActivityStats, derived_fields, local_day
+from schemas import ActivityTypeStats
+
+
+def snapshot(activity) -> tuple:
+    """Capture the activity fields its rollup contribution depends on."""
+    return (activity.profile_id, activity.activity_type, activity.start_time, activity.end_time)
+
+
+def _contribution(activity_snapshot: tuple) -> tuple:
+    profile_id, activity_type, start_time, end_time = activity_snapshot
+    key = (profile_id or 0, local_day(start_time), activity_type)
+    if end_time is None:
+        return key, (1, 0, 0)
+    return key, (1, 1, int((end_time - start_time).total_seconds()))
+
+
+def collect_deltas(changes: Iterable[tuple]) -> dict:
+    """Sum (before, after) snapshot pairs into per-rollup-row deltas.
+
+    Either side of a pair may be None for inserted or deleted activities.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for before, after in changes:
+        for activity_snapshot, sign in ((before, -1), (after, 1)):
+            if activity_snapshot is None:
+                continue
+            key, values = _contribution(activity_snapshot)
+            delta = deltas[key]
+            for i, value in enumerate(values):
+                delta[i] += sign * value
+    return {key: delta for key, delta in deltas.items() if any(delta)}
+
+
+def _rows(deltas: dict) -> list:
+    return [
+        {
+            "profile_id": profile_id,
+            "day": day,
+            "activity_type": activity_type,
+            "count": count,
+            "completed_count": completed_count,
+            "total_duration_seconds": total_duration_seconds,
+        }
+        for (profile_id, day, activity_type), (count, completed_count, total_duration_seconds)
+        in deltas.items()
+    ]
+
+
+# INSERT ... ON CONFLICT constructs of the supported backends
+UPSERT_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+
+def _upsert_statement(dialect_name: str):
+    """INSERT that adds to an existing rollup row instead of failing."""
+    statement = UPSERT_INSERTS[dialect_name](DailyActivityStats)
+    return statement.on_conflict_do_update(
+        index_elements=["profile_id", "day", "activity_type"],
+        set_={
+            "count": DailyActivityStats.count + statement.excluded["count"],
+            "completed_count": DailyActivityStats.completed_count + statement.excluded["completed_count"],
+            "total_duration_seconds": (
+                DailyActivityStats.total_duration_seconds + statement.excluded["total_duration_seconds"]
+            ),
+        },
+    )
+
+
+async def apply_changes(db: AsyncSession, changes: Iterable[tuple]):
+    """Add the effect of activity changes to the rollups in the current transaction."""
+    deltas = collect_deltas(changes)
+    if deltas:
+        await db.execute(_upsert_statement(db.get_bind().dialect.name), _rows(deltas))
+
+
+async def delete_profile_stats(db: AsyncSession, profile_id: int):
+    """Remove the rollups of a deleted profile."""
+    await db.execute(delete(DailyActivityStats).where(DailyActivityStats.profile_id == profile_id))
+
+
+async def get_type_totals(
+    db: AsyncSession,
+    profile_id: Optional[int],
+    start: Optional[date] = None,
+    end: Optional[date] = None
+) -> dict[str, ActivityTypeStats]:
+    """Per activity type totals of a profile over an inclusive range of local days."""
+    query = select(
+        DailyActivityStats.activity_type,
+        func.sum(DailyActivityStats.count),
+        func.sum(DailyActivityStats.completed_count),
+        func.sum(DailyActivityStats.total_duration_seconds),
+    ).where(
+        DailyActivityStats.profile_id == (profile_id or 0)
+    ).group_by(DailyActivityStats.activity_type)
+
+    if start:
+        query = query.where(DailyActivityStats.day >= start)
+    if end:
+        query = query.where(DailyActivityStats.day <= end)
+
+    result = await db.execute(query)
+    return {
+        activity_type: ActivityTypeStats(count=count, completed=completed, total_seconds=total_seconds)
+        for activity_type, count, completed, total_seconds in result.all()
+        if count
+    }
+
+
+def refresh_derived_fields(
+    connection: Connection, batch_size: int = 5000, models: tuple = (Activity, ArchivedActivity)
+):
+    """Recompute every activity's duration_seconds and local_day, in batches by id.
+
+    Archived activities are included unless models leaves ArchivedActivity
+    out, as the legacy migrations do: they run before the archive exists.
+    """
+    for model in models:
+        table = model.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("row_id"))
+            .values(duration_seconds=bindparam("duration_seconds"), local_day=bindparam("local_day"))
+        )
+        last_id = 0
+        while True:
+            batch = connection.execute(
+                select(model.id, model.start_time, model.end_time)
+                .where(model.id > last_id)
+                .order_by(model.id)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            connection.execute(statement, [
+                {"row_id": activity_id, **derived_fields(start_time, end_time)}
+                for activity_id, start_time, end_time in batch
+            ])
+            last_id = batch[-1].id
+
+
+def _stored_snapshots(connection: Connection, models: tuple) -> Iterator[tuple]:
+    for model in models:
+        result = connection.execute(
+            select(model.profile_id, model.activity_type, model.start_time, model.end_time)
+            .execution_options(yield_per=5000)
+        )
+        for row in result:
+            yield tuple(row)
+
+
+def rebuild(connection: Connection, models: tuple = (Activity, ArchivedActivity)) -> int:
+    """Recompute all rollups from the activities and archive tables; returns the row count.
+
+    models lists the tables to read, as for refresh_derived_fields().
+    """
+    connection.execute(delete(DailyActivityStats))
+
+    rows = _rows(collect_deltas((None, stored) for stored in _stored_snapshots(connection, models)))
+    if rows:
+        connection.execute(DailyActivityStats.__table__.insert(), rows)
+    return len(rows)
+
+
+async def _rebuild_database():
+    from database import engine
+
+    async with engine.begin() as conn:
+        # Local days depend on TRACKER_TIMEZONE, which may have changed
+        await conn.run_sync(refresh_derived_fields)
+        count = await conn.run_sync(rebuild)
+    await engine.dispose()
+    print(f"Rebuilt {count} daily activity stats rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the daily activity statistics table")
+    parser.add_argument(
+        "command", choices=["rebuild"],
+        help="rebuild: recompute activity durations, local days and all rollups"
+    )
+    parser.parse_args()
+    asyncio.run(_rebuild_database())
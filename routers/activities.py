@@ -1,89 +1,358 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from typing import List, Optional
-from datetime import datetime
+from sqlalchemy import select, delete, tuple_, literal
+from sqlalchemy.exc import IntegrityError
+from typing import Optional
+from datetime import date, datetime
 
+from config import settings
 from database import get_db
-from models import Activity, BabyProfile
-from schemas import ActivityCreate, ActivityUpdate, ActivityResponse
+from models import Activity, ArchivedActivity, TZDateTime
+from schemas import (
+    ActivityCreate, ActivityUpdate, ActivityResponse, ActivityPage, ActivitySearchPage, TimelinePage,
+    PeriodSummary,
+    BulkImportError, BulkImportResult, ActivityTypeStats, ProfileResponse
+)
+from profile_cache import profile_cache, get_selected_profile, selected_profile_id
+from rollups import apply_changes, snapshot, get_type_totals
+from pubsub import event_bus
+from httpcache import api_etag, apply_etag, check_api_etag, data_version
+from ingest import is_ndjson, iter_ndjson, parse_json_array, validate_item, import_activities
+from pagination import encode_cursor, decode_cursor
+from timeline import DEFAULT_TIMELINE_DAYS, get_timeline_page
+from autoclose import auto_close, release, touched_changes
+from export import EXPORT_MEDIA_TYPES, ExportFormatError, check_export_format, iter_export
+from activity_rows import select_activity_rows
+from archive import get_archived_activity, read_activity_rows, restore_activities, tiered_queries
+from changelog import changed, record_changes
+from write_queue import run_write
+from fragments import fragment_cache
+from periods import MAX_PERIOD_BUCKETS, PeriodError, bucket_bounds, get_period_summary, get_timezone
+from search import SearchQueryError, query_words, search_activities
 
 router = APIRouter(prefix="/api/activities", tags=["activities"])
 
 
+def _publish_activity(event: str, activity: Activity):
+    """Notify live page subscribers about a committed activity change."""
+    event_bus.publish(event, ActivityResponse.model_validate(activity).model_dump(mode="json"))
+
+
+async def _find_by_idempotency_key(db: AsyncSession, idempotency_key: str) -> Optional[Activity]:
+    result = await db.execute(
+        select(Activity).where(Activity.idempotency_key == idempotency_key)
+    )
+    return result.scalar_one_or_none()
+
+
 @router.post("/", response_model=ActivityResponse, status_code=201)
 async def create_activity(
     activity: ActivityCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
     db: AsyncSession = Depends(get_db)
 ):
-    """Create a new activity."""
-    # Get current profile and auto-associate if profile_id not provided
+    """Create a new activity.
+
+    Open activities it follows are ended at its start and, if it is open
+    and backdated before a later activity, it is ended at that activity's
+    start (see autoclose.py). Everything is written in one transaction.
+
+    Clients that retry should send an Idempotency-Key header (a UUID): a
+    repeated key returns the activity the first request created, with an
+    Idempotent-Replayed header, instead of logging it twice.
+    """
+    if idempotency_key:
+        existing = await _find_by_idempotency_key(db, idempotency_key)
+        if existing:
+            response.headers["Idempotent-Replayed"] = "true"
+            return existing
+
+    # Auto-associate the selected profile if profile_id not provided
     if activity.profile_id is None:
-        result = await db.execute(select(BabyProfile))
-        current_profile = result.scalar_one_or_none()
-        if current_profile:
-            activity.profile_id = current_profile.id
-
-    # Auto-close previous activity if it doesn't have an end_time
-    # Find the most recent activity that started before this new one
-    previous_activity_result = await db.execute(
-        select(Activity)
-        .where(Activity.start_time < activity.start_time)
-        .order_by(Activity.start_time.desc())
-        .limit(1)
-    )
-    previous_activity = previous_activity_result.scalar_one_or_none()
+        activity.profile_id = selected_profile_id(profile)
 
-    # If previous activity exists and has no end_time, set it to this activity's start_time
-    if previous_activity and previous_activity.end_time is None:
-        previous_activity.end_time = activity.start_time
-        await db.commit()
+    db_activity = Activity(**activity.model_dump(), idempotency_key=idempotency_key)
+    try:
+        touched = await run_write(db, lambda session: _insert_activity(session, db_activity))
+    except IntegrityError:
+        # A concurrent request with the same key was committed first
+        existing = await _find_by_idempotency_key(db, idempotency_key) if idempotency_key else None
+        if existing is None:
+            raise
+        response.headers["Idempotent-Replayed"] = "true"
+        return existing
 
-    # Create the new activity
-    db_activity = Activity(**activity.model_dump())
+    data_version.bump()
+    profile_cache.invalidate_role(db_activity.profile_id)
+    fragment_cache.invalidate([db_activity.id, *(closed.id for closed in touched)])
+    for closed_activity in touched:
+        _publish_activity("activity.updated", closed_activity)
+    _publish_activity("activity.created", db_activity)
+    return db_activity
+
+
+async def _insert_activity(db: AsyncSession, db_activity: Activity) -> dict:
+    """Transaction of create_activity, without the commit; returns the activities it closed."""
+    touched = {}
+    await auto_close(db, db_activity, touched)
     db.add(db_activity)
-    await db.commit()
+    await db.flush()
+    await apply_changes(db, [(None, snapshot(db_activity)), *touched_changes(touched)])
+    await record_changes(db, [changed(db_activity), *map(changed, touched)])
     await db.refresh(db_activity)
-    return db_activity
+    return touched
+
+
+@router.post("/bulk", response_model=BulkImportResult, status_code=201)
+async def bulk_create_activities(
+    request: Request,
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
+    db: AsyncSession = Depends(get_db)
+):
+    """Import many activities in one transaction.
+
+    Accepts a JSON array of activities, or newline-delimited JSON when sent
+    as application/x-ndjson. Invalid items are skipped and reported by their
+    position in the input; all valid items are imported. Items without a
+    profile_id go to the selected profile.
+    """
+    items = []
+    if is_ndjson(request.headers.get("content-type", "")):
+        async for item in iter_ndjson(request.stream()):
+            items.append(item)
+    else:
+        try:
+            items = [(item, None) for item in parse_json_array(await request.body())]
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    activities = []
+    errors = []
+    for index, (item, error) in enumerate(items):
+        if error is None:
+            try:
+                activities.append(validate_item(item))
+                continue
+            except ValueError as e:
+                error = str(e)
+        errors.append(BulkImportError(index=index, detail=error))
 
+    result = await import_activities(db, activities, errors, selected_profile_id(profile))
+    data_version.bump()
+    profile_cache.invalidate_role()
+    # The activities an import closed are not reported back
+    fragment_cache.invalidate()
+    if result.created:
+        event_bus.publish("activities.imported", {"created": result.created})
+    return result
 
-@router.get("/", response_model=List[ActivityResponse])
+
+@router.get("/", response_model=ActivityPage)
 async def list_activities(
+    request: Request,
+    etag: str = Depends(api_etag),
     activity_type: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
     db: AsyncSession = Depends(get_db)
 ):
-    """List all activities with optional filters."""
-    query = select(Activity)
+    """List a profile's activities newest first with optional filters.
+
+    Results are paginated with keyset cursors on (start_time, id): pass the
+    returned next_cursor as cursor to fetch the following page. Archived
+    activities are read once a page gets past the recent ones. Rows are
+    read as plain columns and encoded with orjson, skipping ORM entities
+    and Pydantic validation; response_model only documents the shape.
+    """
+    profile_id = selected_profile_id(profile)
+    keyset = _parse_activity_cursor(cursor) if cursor else None
+
+    def page_rows(model):
+        query = select_activity_rows(model).where(model.for_profile(profile_id))
+        if activity_type:
+            query = query.where(model.activity_type == activity_type)
+        if start_date:
+            query = query.where(model.start_time >= start_date)
+        if end_date:
+            query = query.where(model.start_time <= end_date)
+        if keyset:
+            cursor_start, cursor_id = keyset
+            query = query.where(
+                tuple_(model.start_time, model.id)
+                < tuple_(literal(cursor_start, TZDateTime), literal(cursor_id))
+            )
+        return query
 
-    if activity_type:
-        query = query.where(Activity.activity_type == activity_type)
+    # Fetch one extra row to find out whether another page exists
+    activities = await read_activity_rows(db, await tiered_queries(db, profile_id, page_rows), limit + 1)
 
-    if start_date:
-        query = query.where(Activity.start_time >= start_date)
+    next_cursor = None
+    if len(activities) > limit:
+        activities = activities[:limit]
+        last = activities[-1]
+        next_cursor = encode_cursor(last["start_time"].isoformat(), last["id"])
 
-    if end_date:
-        query = query.where(Activity.start_time <= end_date)
+    # A returned Response skips the headers api_etag set, so copy them over
+    return apply_etag(request, ORJSONResponse({"items": activities, "next_cursor": next_cursor}))
 
-    query = query.order_by(Activity.start_time.desc()).limit(limit)
 
-    result = await db.execute(query)
-    activities = result.scalars().all()
-    return activities
+def _parse_activity_cursor(cursor: str):
+    """Decode a list_activities cursor into its (start_time, id) keyset values."""
+    try:
+        start_time, activity_id = decode_cursor(cursor)
+        return datetime.fromisoformat(start_time), int(activity_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/stats", response_model=dict[str, ActivityTypeStats])
+async def get_activity_stats(
+    etag: str = Depends(api_etag),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a profile's per-type counts and durations over an inclusive range of local days."""
+    return await get_type_totals(db, selected_profile_id(profile), start=start_date, end=end_date)
+
+
+@router.get("/timeline", response_model=TimelinePage)
+async def get_timeline(
+    request: Request,
+    etag: str = Depends(api_etag),
+    before: Optional[date] = None,
+    days: int = Query(DEFAULT_TIMELINE_DAYS, ge=1, le=90),
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a profile's activities grouped by day, newest first.
+
+    Pass the returned next_before as before to load older days.
+    """
+    page = await get_timeline_page(db, selected_profile_id(profile), before=before, days=days)
+    return apply_etag(request, ORJSONResponse(page))
+
+
+@router.get("/periods", response_model=PeriodSummary)
+async def get_periods(
+    request: Request,
+    period: str = Query("day", description="day, week or month"),
+    tz: Optional[str] = Query(None, description="IANA timezone; defaults to TRACKER_TIMEZONE"),
+    end: Optional[date] = Query(None, description="a local day in the last bucket; defaults to today"),
+    count: int = Query(7, ge=1, le=MAX_PERIOD_BUCKETS),
+    include_activities: bool = False,
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a profile's activity totals per local day, week or month, oldest first.
+
+    Returns count buckets ending with the one that contains end, so
+    ``period=day&count=1`` is today, ``period=day&count=7`` the last seven
+    days and ``period=month&count=1`` this month. Counts and durations are
+    computed in the database; pass include_activities to also list each
+    bucket's activities.
+    """
+    try:
+        tz_info = get_timezone(tz or settings.tracker_timezone)
+        if end is None:
+            end = datetime.now(tz_info).date()
+        # Validate before the ETag check so a bad request never gets a 304
+        bucket_bounds(period, tz_info, end, count)
+    except PeriodError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # The default end moves with the local date, so it is part of the ETag
+    check_api_etag(request, end.isoformat())
+    summary = await get_period_summary(
+        db, selected_profile_id(profile), period, tz_info, end, count, include_activities
+    )
+    return apply_etag(request, ORJSONResponse(summary))
+
+
+@router.get("/search", response_model=ActivitySearchPage)
+async def search_activity_notes(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200, description="words to find in notes"),
+    activity_type: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
+    db: AsyncSession = Depends(get_db)
+):
+    """Search a profile's activity notes, best match first.
+
+    Every word must match the start of a word in the notes, so ``spit u``
+    finds "spit up". Each hit carries an HTML snippet of its notes with
+    the matches in <mark>. Pass the returned next_cursor as cursor to fetch
+    the following page.
+    """
+    try:
+        query_words(q)
+    except SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    after = _parse_search_cursor(cursor) if cursor else None
+
+    check_api_etag(request)
+    page = await search_activities(
+        db, selected_profile_id(profile), q, activity_type, start_date, end_date, limit, after
+    )
+    return apply_etag(request, ORJSONResponse(page))
+
+
+def _parse_search_cursor(cursor: str):
+    """Decode a search cursor into its (rank, id) keyset values."""
+    try:
+        rank, activity_id = decode_cursor(cursor)
+        return float(rank), int(activity_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/export")
+async def export_activities(
+    format: str = Query("csv", description="csv, ndjson or parquet"),
+    activity_type: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile)
+):
+    """Download a profile's full activity history, oldest first.
+
+    The file is streamed in batches, so memory use stays constant however
+    much history there is. Parquet needs the optional pyarrow package.
+    """
+    try:
+        check_export_format(format)
+    except ExportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        iter_export(format, selected_profile_id(profile), activity_type, start_date, end_date),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="activities.{format}"'}
+    )
 
 
 @router.get("/{activity_id}", response_model=ActivityResponse)
 async def get_activity(
     activity_id: int,
+    etag: str = Depends(api_etag),
     db: AsyncSession = Depends(get_db)
 ):
     """Get a specific activity by ID."""
     result = await db.execute(
         select(Activity).where(Activity.id == activity_id)
     )
-    activity = result.scalar_one_or_none()
+    activity = result.scalar_one_or_none() or await get_archived_activity(db, activity_id)
 
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
@@ -98,21 +367,63 @@ async def update_activity(
     db: AsyncSession = Depends(get_db)
 ):
     """Update an existing activity."""
-    result = await db.execute(
-        select(Activity).where(Activity.id == activity_id)
+    update_data = activity_update.model_dump(exclude_unset=True)
+    activity, touched = await run_write(
+        db, lambda session: _apply_activity_update(session, activity_id, update_data)
     )
-    activity = result.scalar_one_or_none()
+    data_version.bump()
+    profile_cache.invalidate_role()
+    fragment_cache.invalidate([activity.id, *(closed.id for closed in touched)])
+    for closed_activity in touched:
+        _publish_activity("activity.updated", closed_activity)
+    _publish_activity("activity.updated", activity)
+    return activity
 
-    if not activity:
-        raise HTTPException(status_code=404, detail="Activity not found")
+
+async def _apply_activity_update(db: AsyncSession, activity_id: int, update_data: dict) -> tuple:
+    """Transaction of update_activity, without the commit; returns the activity and those it closed."""
+    activity = await _load_for_write(db, activity_id)
 
     # Update only provided fields
-    update_data = activity_update.model_dump(exclude_unset=True)
+    before = snapshot(activity)
+    previous_profile_id = activity.profile_id
+
+    # Moving an activity re-ends the activities it auto-closed at its old
+    # position and applies the close rules at its new one
+    touched = {}
+    moved = bool(update_data.keys() & {"start_time", "activity_type", "profile_id"})
+    if moved:
+        await release(db, activity, touched)
+
     for key, value in update_data.items():
         setattr(activity, key, value)
 
-    await db.commit()
+    if "end_time" in update_data:
+        activity.auto_closed = False
+    elif moved and activity.auto_closed:
+        activity.end_time = None
+        activity.auto_closed = False
+    if moved or activity.end_time is None:
+        await auto_close(db, activity, touched)
+    touched.pop(activity, None)
+
+    await apply_changes(db, [(before, snapshot(activity)), *touched_changes(touched)])
+    # Listed under its old profile as well, where it now reads as deleted
+    await record_changes(db, [(activity.id, previous_profile_id), changed(activity), *map(changed, touched)])
+    await db.flush()
     await db.refresh(activity)
+    return activity, touched
+
+
+async def _load_for_write(db: AsyncSession, activity_id: int) -> Activity:
+    """An activity about to be changed, moved back from the archive if it is archived."""
+    query = select(Activity).where(Activity.id == activity_id)
+    activity = (await db.execute(query)).scalar_one_or_none()
+    if activity is None and await restore_activities(db, ArchivedActivity.id == activity_id):
+        activity = (await db.execute(query)).scalar_one_or_none()
+
+    if not activity:
+        raise HTTPException(status_code=404, detail="Activity not found")
     return activity
 
 
@@ -122,14 +433,20 @@ async def delete_activity(
     db: AsyncSession = Depends(get_db)
 ):
     """Delete an activity."""
-    result = await db.execute(
-        select(Activity).where(Activity.id == activity_id)
-    )
-    activity = result.scalar_one_or_none()
+    activity = await _load_for_write(db, activity_id)
 
-    if not activity:
-        raise HTTPException(status_code=404, detail="Activity not found")
+    # Activities it auto-closed are ended by the next activity instead
+    touched = {}
+    await release(db, activity, touched)
 
     await db.delete(activity)
+    await apply_changes(db, [(snapshot(activity), None), *touched_changes(touched)])
+    await record_changes(db, [changed(activity), *map(changed, touched)])
     await db.commit()
+    data_version.bump()
+    profile_cache.invalidate_role(activity.profile_id)
+    fragment_cache.invalidate([activity_id, *(closed.id for closed in touched)])
+    for closed_activity in touched:
+        _publish_activity("activity.updated", closed_activity)
+    event_bus.publish("activity.deleted", {"id": activity_id, "profile_id": activity.profile_id})
     return None
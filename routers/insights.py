@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db
+from httpcache import apply_etag, check_api_etag
+from insights import get_insights
+from profile_cache import profile_cache
+from schemas import Insights
+
+router = APIRouter(prefix="/api/insights", tags=["insights"])
+
+
+@router.get("/{profile_id}", response_model=Insights)
+async def get_profile_insights(
+    profile_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a profile's feeding and sleep patterns and when the next of each is likely.
+
+    Times of day and days are local (TRACKER_TIMEZONE). Results are
+    computed once per data change and then served from memory.
+    """
+    if await profile_cache.get_profile(db, profile_id) is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    check_api_etag(request, profile_id)
+    insights = await get_insights(db, profile_id)
+    return apply_etag(request, ORJSONResponse(insights))
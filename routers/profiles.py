@@ -1,54 +1,73 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import Optional
 from datetime import date
-import os
-import shutil
-from pathlib import Path
 
 from database import get_db
 from models import BabyProfile
 from schemas import ProfileCreate, ProfileUpdate, ProfileResponse
+from profile_cache import profile_cache, get_selected_profile, PROFILE_COOKIE
+from rollups import delete_profile_stats
+from changelog import delete_profile_changes
+from archive import delete_profile_archive
+from fragments import fragment_cache
+from pubsub import event_bus
+from httpcache import api_etag, data_version
+from images import InvalidImageError, store_profile_photo, delete_profile_photo
 
 router = APIRouter(prefix="/api/profiles", tags=["profiles"])
 
-# Define upload directory
-UPLOAD_DIR = Path("static/uploads/profiles")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+# Keep the profile selection for a year
+PROFILE_COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+async def _store_photo(photo: UploadFile) -> str:
+    """Store an uploaded photo, rejecting files that are not images."""
+    try:
+        return await store_profile_photo(photo)
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _release_photo(db: AsyncSession, photo_path: Optional[str], profile_id: int):
+    """Delete a profile's photo files unless another profile uses the same image.
+
+    Stored photos are named after their content, so the same upload on two
+    profiles shares one set of files.
+    """
+    if not photo_path:
+        return
+    result = await db.execute(
+        select(BabyProfile.id)
+        .where(BabyProfile.photo_path == photo_path, BabyProfile.id != profile_id)
+        .limit(1)
+    )
+    if result.scalar_one_or_none() is None:
+        await delete_profile_photo(photo_path)
+
+
+def _select_profile(response: Response, profile_id: int):
+    """Remember the selected profile on this device."""
+    response.set_cookie(
+        PROFILE_COOKIE, str(profile_id),
+        max_age=PROFILE_COOKIE_MAX_AGE, httponly=True, samesite="lax"
+    )
 
 
 @router.post("/", response_model=ProfileResponse, status_code=201)
 async def create_profile(
+    response: Response,
     name: str = Form(...),
     birthday: date = Form(...),
     photo: Optional[UploadFile] = File(None),
     db: AsyncSession = Depends(get_db)
 ):
-    """Create a new baby profile. Only one profile can exist at a time."""
-    # Check if a profile already exists
-    result = await db.execute(select(BabyProfile))
-    existing_profile = result.scalar_one_or_none()
-
-    if existing_profile:
-        raise HTTPException(
-            status_code=400,
-            detail="A baby profile already exists. Please delete the existing profile first."
-        )
-
+    """Create a new baby profile and select it on this device."""
     # Handle photo upload
     photo_path = None
-    if photo:
-        # Generate unique filename
-        file_extension = os.path.splitext(photo.filename)[1]
-        filename = f"baby_profile{file_extension}"
-        file_path = UPLOAD_DIR / filename
-
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(photo.file, buffer)
-
-        photo_path = f"/static/uploads/profiles/{filename}"
+    if photo and photo.filename:
+        photo_path = await _store_photo(photo)
 
     # Create profile
     db_profile = BabyProfile(
@@ -59,21 +78,50 @@ async def create_profile(
     db.add(db_profile)
     await db.commit()
     await db.refresh(db_profile)
+    data_version.bump()
+    profile_cache.invalidate_profile()
+    event_bus.publish("profile.changed")
+    _select_profile(response, db_profile.id)
     return db_profile
 
 
-@router.get("/current", response_model=ProfileResponse)
-async def get_current_profile(db: AsyncSession = Depends(get_db)):
-    """Get the current baby profile."""
-    result = await db.execute(select(BabyProfile))
-    profile = result.scalar_one_or_none()
+@router.get("/", response_model=list[ProfileResponse])
+async def list_profiles(
+    etag: str = Depends(api_etag),
+    db: AsyncSession = Depends(get_db)
+):
+    """List all baby profiles, oldest first."""
+    return await profile_cache.get_profiles(db)
 
+
+@router.get("/current", response_model=ProfileResponse)
+async def get_current_profile(
+    etag: str = Depends(api_etag),
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile)
+):
+    """Get the baby profile selected on this device."""
     if not profile:
         raise HTTPException(status_code=404, detail="No baby profile found")
 
     return profile
 
 
+@router.post("/{profile_id}/select", response_model=ProfileResponse)
+async def select_profile(
+    profile_id: int,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
+):
+    """Select the profile that pages and activity routes use on this device."""
+    profile = await profile_cache.get_profile(db, profile_id)
+
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    _select_profile(response, profile.id)
+    return profile
+
+
 @router.put("/{profile_id}", response_model=ProfileResponse)
 async def update_profile(
     profile_id: int,
@@ -82,7 +130,7 @@ async def update_profile(
     photo: Optional[UploadFile] = File(None),
     db: AsyncSession = Depends(get_db)
 ):
-    """Update the baby profile."""
+    """Update a baby profile."""
     result = await db.execute(
         select(BabyProfile).where(BabyProfile.id == profile_id)
     )
@@ -98,25 +146,20 @@ async def update_profile(
         profile.birthday = birthday
 
     # Handle photo upload
-    if photo:
-        # Delete old photo if exists
-        if profile.photo_path:
-            old_photo_path = Path(profile.photo_path.lstrip('/'))
-            if old_photo_path.exists():
-                old_photo_path.unlink()
-
-        # Save new photo
-        file_extension = os.path.splitext(photo.filename)[1]
-        filename = f"baby_profile{file_extension}"
-        file_path = UPLOAD_DIR / filename
+    if photo and photo.filename:
+        photo_path = await _store_photo(photo)
 
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(photo.file, buffer)
+        # Delete old photo if it was replaced
+        if profile.photo_path and profile.photo_path != photo_path:
+            await _release_photo(db, profile.photo_path, profile.id)
 
-        profile.photo_path = f"/static/uploads/profiles/{filename}"
+        profile.photo_path = photo_path
 
     await db.commit()
     await db.refresh(profile)
+    data_version.bump()
+    profile_cache.invalidate_profile()
+    event_bus.publish("profile.changed")
     return profile
 
 
@@ -125,7 +168,7 @@ async def delete_profile(
     profile_id: int,
     db: AsyncSession = Depends(get_db)
 ):
-    """Delete the baby profile and all associated activities."""
+    """Delete a baby profile and all associated activities."""
     result = await db.execute(
         select(BabyProfile).where(BabyProfile.id == profile_id)
     )
@@ -135,12 +178,17 @@ async def delete_profile(
         raise HTTPException(status_code=404, detail="Profile not found")
 
     # Delete photo if exists
-    if profile.photo_path:
-        photo_path = Path(profile.photo_path.lstrip('/'))
-        if photo_path.exists():
-            photo_path.unlink()
+    await _release_photo(db, profile.photo_path, profile.id)
 
     # Delete profile (activities will be cascade deleted)
     await db.delete(profile)
+    await delete_profile_stats(db, profile_id)
+    await delete_profile_changes(db, profile_id)
+    await delete_profile_archive(db, profile_id)
     await db.commit()
+    # Activities are cascade deleted too, so the current role changes as well
+    data_version.bump()
+    profile_cache.invalidate()
+    fragment_cache.invalidate()
+    event_bus.publish("profile.changed")
     return None
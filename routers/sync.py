@@ -0,0 +1,37 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from changelog import DEFAULT_SYNC_LIMIT, SyncVersionError, get_changes
+from database import get_db
+from httpcache import api_etag, apply_etag
+from profile_cache import get_selected_profile, selected_profile_id
+from schemas import ProfileResponse, SyncPage
+
+router = APIRouter(prefix="/api/sync", tags=["sync"])
+
+
+@router.get("", response_model=SyncPage)
+async def sync_activities(
+    request: Request,
+    since: int = Query(0, ge=0, description="version returned by the previous sync; 0 for everything"),
+    limit: int = Query(DEFAULT_SYNC_LIMIT, ge=1, le=5000),
+    etag: str = Depends(api_etag),
+    profile: Optional[ProfileResponse] = Depends(get_selected_profile),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the selected profile's activities changed since a sync version.
+
+    Changed activities are returned with their current state and deleted
+    ones (or ones moved to another profile) as ids in deleted. Store the
+    returned version and pass it as since next time; while has_more is set,
+    call again straight away. A 410 means the server's log was reset and
+    the client should drop its copy and sync from 0.
+    """
+    try:
+        changes = await get_changes(db, selected_profile_id(profile), since, limit)
+    except SyncVersionError as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    return apply_etag(request, ORJSONResponse(changes))
@@ -3,6 +3,14 @@ from datetime import datetime, timezone, date
 from typing import Optional
 from models import ActivityType
 
+ACTIVITY_TYPES = tuple(activity_type.value for activity_type in ActivityType)
+
+
+def check_activity_type(value: Optional[str]) -> Optional[str]:
+    if value is not None and value not in ACTIVITY_TYPES:
+        raise ValueError(f"Unknown activity type, expected one of {', '.join(ACTIVITY_TYPES)}")
+    return value
+
 
 class ActivityBase(BaseModel):
     activity_type: str
@@ -26,7 +34,11 @@ class ActivityBase(BaseModel):
 
 
 class ActivityCreate(ActivityBase):
-    pass
+    @field_validator('activity_type')
+    @classmethod
+    def ensure_known_type(cls, v: Optional[str]) -> Optional[str]:
+        """Only accept the activity types the app knows."""
+        return check_activity_type(v)
 
 
 class ActivityUpdate(BaseModel):
@@ -49,10 +61,19 @@ class ActivityUpdate(BaseModel):
         # Convert to UTC
         return v.astimezone(timezone.utc)
 
+    @field_validator('activity_type')
+    @classmethod
+    def ensure_known_type(cls, v: Optional[str]) -> Optional[str]:
+        """Only accept the activity types the app knows."""
+        return check_activity_type(v)
+
 
 class ActivityResponse(ActivityBase):
     id: int
     created_at: datetime
+    auto_closed: bool = False
+    duration_seconds: Optional[int] = None
+    local_day: Optional[date] = None
 
     model_config = {
         'from_attributes': True,
@@ -62,6 +83,21 @@ class ActivityResponse(ActivityBase):
     }
 
 
+class ActivityPage(BaseModel):
+    items: list[ActivityResponse]
+    next_cursor: Optional[str] = None
+
+
+class ActivitySearchHit(ActivityResponse):
+    # HTML: an escaped excerpt of the notes with the matches in <mark>
+    snippet: str
+
+
+class ActivitySearchPage(BaseModel):
+    items: list[ActivitySearchHit]
+    next_cursor: Optional[str] = None
+
+
 # Baby Profile Schemas
 class ProfileBase(BaseModel):
     name: str
@@ -90,3 +126,137 @@ class ProfileResponse(ProfileBase):
             date: lambda v: v.isoformat() if v else None
         }
     }
+
+
+# Analytics Schemas
+class ActivityTypeStats(BaseModel):
+    count: int = 0
+    completed: int = 0
+    total_seconds: float = 0
+
+    @property
+    def total_hours(self) -> float:
+        return round(self.total_seconds / 3600, 1)
+
+    @property
+    def avg_minutes(self) -> int:
+        if not self.completed:
+            return 0
+        return round(self.total_seconds / 60 / self.completed)
+
+
+class AnalyticsSummary(BaseModel):
+    total: int = 0
+    by_type: dict[str, ActivityTypeStats] = {}
+    role_counts: dict[str, int] = {}
+    first_start: Optional[datetime] = None
+    latest_start: Optional[datetime] = None
+    latest_type: Optional[str] = None
+
+    def stats(self, activity_type: str) -> ActivityTypeStats:
+        """Get stats for an activity type, empty if none were recorded."""
+        return self.by_type.get(activity_type) or ActivityTypeStats()
+
+    @property
+    def days_tracked(self) -> int:
+        if self.first_start is None or self.latest_start is None:
+            return 0
+        return (self.latest_start - self.first_start).days + 1
+
+    def per_day(self, activity_type: str) -> float:
+        """Average number of activities of a type per tracked day."""
+        if not self.days_tracked:
+            return 0
+        return round(self.stats(activity_type).count / self.days_tracked, 1)
+
+
+# Insights Schemas
+class IntervalStats(BaseModel):
+    count: int = 0
+    mean_minutes: Optional[float] = None
+    median_minutes: Optional[float] = None
+    p25_minutes: Optional[float] = None
+    p75_minutes: Optional[float] = None
+
+
+class EventPrediction(BaseModel):
+    expected_at: datetime
+    # Interquartile range of the intervals the prediction is based on
+    earliest: datetime
+    latest: datetime
+    # Start of the interval: the last feeding's start or the last sleep's end
+    last_at: datetime
+    samples: int
+
+
+class InsightDay(BaseModel):
+    date: date
+    feedings: int
+    sleep_hours: float
+    # Averages over this day and the six before it
+    feedings_avg7: float
+    sleep_hours_avg7: float
+
+
+class Insights(BaseModel):
+    timezone: str
+    feeding_intervals: IntervalStats
+    sleep_durations: IntervalStats
+    awake_windows: IntervalStats
+    # Next feeding start and next sleep start, when there is enough history
+    predictions: dict[str, Optional[EventPrediction]]
+    daily: list[InsightDay]
+    # Starts per local hour (24 values) and per weekday and hour (7 rows,
+    # Monday first, of 24 values), by activity type
+    hourly: dict[str, list[int]]
+    heatmap: dict[str, list[list[int]]]
+
+
+# Timeline Schemas
+class TimelineDay(BaseModel):
+    date: date
+    counts: dict[str, int]
+    activities: list[ActivityResponse]
+
+
+class TimelinePage(BaseModel):
+    days: list[TimelineDay]
+    next_before: Optional[date] = None
+
+
+class PeriodBucket(BaseModel):
+    # Local days: start is the first day of the bucket, end the first day after it
+    start: date
+    end: date
+    # The same boundaries as UTC instants
+    start_time: datetime
+    end_time: datetime
+    total: int = 0
+    by_type: dict[str, ActivityTypeStats] = {}
+    activities: Optional[list[ActivityResponse]] = None
+
+
+class PeriodSummary(BaseModel):
+    period: str
+    timezone: str
+    buckets: list[PeriodBucket]
+
+
+# Sync Schemas
+class SyncPage(BaseModel):
+    version: int
+    activities: list[ActivityResponse]
+    deleted: list[int]
+    has_more: bool = False
+
+
+# Bulk Import Schemas
+class BulkImportError(BaseModel):
+    index: int
+    detail: str
+
+
+class BulkImportResult(BaseModel):
+    created: int
+    closed: int
+    errors: list[BulkImportError]
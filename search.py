@@ -0,0 +1,167 @@
+"""Full-text search over activity notes.
+
+On SQLite the notes are indexed by the activity_notes_fts FTS5 table, which
+triggers on activities keep in sync (alembic revision 0002), and matches are
+ranked with bm25. On PostgreSQL a GIN index on the notes' tsvector serves
+the same queries, ranked with ts_rank; there accents are significant, while
+SQLite ignores them. Either way a search reads the index instead of
+scanning every note with LIKE. Archived notes have indexes of their own
+(archived_notes_fts, alembic revision 0003), searched as well unless
+start_date is later than the profile's archive.
+
+Every word of a query must match, as a prefix, so ``spit u`` finds "spit
+up". Hits come best match first, ties newest id first, and are paginated
+with keyset cursors on (rank, id). Ranks depend on the whole index, so a
+page fetched after notes changed may repeat or skip a hit. bm25 weighs
+words by how common they are in its own index, so on SQLite archiving can
+reorder hits a little.
+"""
+import html
+import re
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, column, func, literal_column, or_, select, table, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from activity_rows import activity_dicts, activity_row_columns
+from archive import get_archive_bounds
+from models import Activity, ArchivedActivity
+from pagination import encode_cursor
+
+# Letters and digits; the FTS5 unicode61 tokenizer splits on everything else
+WORD_RE = re.compile(r"[^\W_]+")
+
+MAX_QUERY_WORDS = 16
+
+# Words of notes shown around the matches in a snippet
+SNIPPET_WORDS = 16
+
+# Placeholders the database wraps matches in, replaced after HTML escaping
+_MATCH_START = "\x02"
+_MATCH_END = "\x03"
+
+# FTS5 table indexing the notes of each activities table on SQLite
+NOTES_FTS_TABLES = {Activity: "activity_notes_fts", ArchivedActivity: "archived_notes_fts"}
+
+
+class SearchQueryError(ValueError):
+    pass
+
+
+def query_words(q: str) -> list[str]:
+    """The words of a search query, lowercased."""
+    words = WORD_RE.findall(q.lower())
+    if not words:
+        raise SearchQueryError("Search query has no words")
+    if len(words) > MAX_QUERY_WORDS:
+        raise SearchQueryError(f"Search query has more than {MAX_QUERY_WORDS} words")
+    return words
+
+
+def highlight(snippet: str) -> str:
+    """Escape a database snippet for HTML and wrap its matches in <mark>."""
+    return html.escape(snippet).replace(_MATCH_START, "<mark>").replace(_MATCH_END, "</mark>")
+
+
+def _sqlite_search(model, words: list[str]):
+    name = NOTES_FTS_TABLES[model]
+    notes_fts, notes_fts_ref = table(name, column("rowid")), literal_column(name)
+    # Quoted, so words are never read as FTS5 operators
+    match = " ".join(f'"{word}"*' for word in words)
+    query = (
+        select(model.id)
+        .select_from(notes_fts)
+        .join(model, model.id == notes_fts.c.rowid)
+        .where(notes_fts_ref.match(match))
+    )
+    rank = func.bm25(notes_fts_ref)
+    snippet = func.snippet(notes_fts_ref, 0, _MATCH_START, _MATCH_END, "…", SNIPPET_WORDS)
+    return query, rank, snippet
+
+
+def _postgresql_search(model, words: list[str]):
+    # Must match the expression of ix_activities_notes_search (and
+    # ix_activities_archive_notes_search) exactly, constants included, for
+    # the index to be used
+    notes = func.coalesce(model.notes, literal_column("''"))
+    document = func.to_tsvector(literal_column("'simple'"), notes)
+    tsquery = func.to_tsquery(literal_column("'simple'"), " & ".join(f"{word}:*" for word in words))
+    query = select(model.id).where(document.op("@@")(tsquery))
+    # ts_rank grows with relevance; negated so that lower is better, like bm25
+    rank = -func.ts_rank(document, tsquery)
+    snippet = func.ts_headline(
+        literal_column("'simple'"), notes, tsquery,
+        f"StartSel={_MATCH_START}, StopSel={_MATCH_END}, MaxWords={SNIPPET_WORDS}, MinWords=5",
+    )
+    return query, rank, snippet
+
+
+SEARCH_BACKENDS = {"sqlite": _sqlite_search, "postgresql": _postgresql_search}
+
+
+async def search_activities(
+    db: AsyncSession,
+    profile_id: Optional[int],
+    q: str,
+    activity_type: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    limit: int = 20,
+    after: Optional[tuple[float, int]] = None,
+) -> dict:
+    """A page of a profile's activities whose notes match q, best match first.
+
+    after is the (rank, id) keyset of the last hit of the previous page.
+    The page is shaped like ActivitySearchPage and ready for ORJSONResponse.
+    """
+    words = query_words(q)
+    models = [Activity]
+    archive = await get_archive_bounds(db, profile_id)
+    if archive is not None and (start_date is None or start_date <= archive.last_start):
+        models.append(ArchivedActivity)
+
+    backend = SEARCH_BACKENDS[db.get_bind().dialect.name]
+    searches = [(model, *backend(model, words)) for model in models]
+    queries = []
+    for model, matches, rank, snippet in searches:
+        query = matches.with_only_columns(*activity_row_columns(model), rank.label("rank")).where(
+            model.for_profile(profile_id)
+        )
+
+        if activity_type:
+            query = query.where(model.activity_type == activity_type)
+        if start_date:
+            query = query.where(model.start_time >= start_date)
+        if end_date:
+            query = query.where(model.start_time <= end_date)
+
+        if after:
+            after_rank, after_id = after
+            query = query.where(or_(rank > after_rank, and_(rank == after_rank, model.id < after_id)))
+        queries.append(query)
+
+    query = queries[0] if len(queries) == 1 else union_all(*queries)
+    columns = query.selected_columns
+    # Fetch one extra row to find out whether another page exists
+    result = await db.execute(query.order_by(columns.rank, columns.id.desc()).limit(limit + 1))
+    hits = activity_dicts(result)
+
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_cursor(hits[-1]["rank"], hits[-1]["id"])
+
+    # Snippets are costly, so they are made for this page's hits only
+    # rather than for every match the ranking has to look at. Ids are
+    # unique across both tables.
+    snippets = {}
+    if hits:
+        hit_ids = [hit["id"] for hit in hits]
+        for model, matches, rank, snippet in searches:
+            result = await db.execute(matches.with_only_columns(model.id, snippet).where(model.id.in_(hit_ids)))
+            snippets.update(result.all())
+    for hit in hits:
+        del hit["rank"]
+        hit["snippet"] = highlight(snippets[hit["id"]])
+    return {"items": hits, "next_cursor": next_cursor}
@@ -0,0 +1,192 @@
+// Shared activity card rendering and live updates for the dashboard and timeline.
+
+const ACTIVITY_ICONS = {sleep: '💤', feeding: '🍼', diaper: '🧷', play: '🎨'};
+
+const TIME_FORMATS = {
+    datetime: {year: 'numeric', month: '2-digit', day: '2-digit', hour: '2-digit', minute: '2-digit', hour12: false},
+    time: {hour: '2-digit', minute: '2-digit', hour12: false}
+};
+
+const HTML_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'};
+
+// Escape text for use in markup, inside attribute values too
+function escapeHtml(value) {
+    return String(value).replace(/[&<>"']/g, (character) => HTML_ESCAPES[character]);
+}
+
+function formatLocalTime(isoString, format) {
+    const date = new Date(isoString);
+    if (format === 'time') {
+        return date.toLocaleTimeString(undefined, TIME_FORMATS.time);
+    }
+    return date.toLocaleString(undefined, TIME_FORMATS.datetime);
+}
+
+// Build the markup of one activity card; mirrors the server-rendered cards
+function renderActivityCard(activity, options = {}) {
+    const format = options.timeFormat || 'datetime';
+    const extraClass = options.extraClass ? ` ${options.extraClass}` : '';
+    const type = escapeHtml(activity.activity_type);
+    const icon = ACTIVITY_ICONS[activity.activity_type] || '📝';
+    const title = type.charAt(0).toUpperCase() + type.slice(1);
+
+    let details = `<strong>Start:</strong> <span class="local-time" data-utc="${activity.start_time}">${formatLocalTime(activity.start_time, format)}</span>`;
+    if (activity.end_time) {
+        const minutes = Math.round((new Date(activity.end_time) - new Date(activity.start_time)) / 60000);
+        details += `<br><strong>End:</strong> <span class="local-time" data-utc="${activity.end_time}">${formatLocalTime(activity.end_time, format)}</span>`;
+        details += `<br><strong>Duration:</strong> ${minutes} minutes`;
+    }
+    if (activity.role) {
+        details += `<br><strong>By:</strong> ${escapeHtml(activity.role)}`;
+    }
+    const notes = activity.notes ? `<p class="activity-notes">📝 ${escapeHtml(activity.notes)}</p>` : '';
+
+    return `
+        <article class="activity-card ${type}${extraClass}" data-type="${type}" data-id="${activity.id}" data-start="${activity.start_time}">
+            <div class="activity-header">
+                <span class="activity-type-badge">${icon} ${title}</span>
+                <div class="activity-actions">
+                    <a href="/edit/${activity.id}" class="btn-edit" aria-label="Edit ${type} activity">Edit</a>
+                    <button onclick="deleteActivity(${activity.id})" class="btn-delete" aria-label="Delete ${type} activity">Delete</button>
+                </div>
+            </div>
+            <div class="activity-body">
+                <p class="activity-time">${details}</p>
+                ${notes}
+            </div>
+        </article>`;
+}
+
+function findActivityCard(id) {
+    return document.querySelector(`.activity-card[data-id="${id}"]`);
+}
+
+// Insert a card into a container whose cards are ordered newest first.
+// Returns the inserted element, or null if it belongs after the last card
+// and allowAppend is false.
+function insertActivityCard(container, html, startTime, allowAppend = true) {
+    const start = new Date(startTime);
+    const template = document.createElement('template');
+    template.innerHTML = html.trim();
+    const card = template.content.firstElementChild;
+
+    for (const existing of container.querySelectorAll('.activity-card')) {
+        if (new Date(existing.dataset.start) < start) {
+            container.insertBefore(card, existing);
+            return card;
+        }
+    }
+    if (!allowAppend) {
+        return null;
+    }
+    container.appendChild(card);
+    return card;
+}
+
+// Profile shown on this page (set on <body> by the server)
+function currentProfileId() {
+    const value = document.body.dataset.profileId;
+    return value ? Number(value) : null;
+}
+
+// Fetch the changes made since the page's sync version (data-sync-version
+// on <body>) and apply them through the page's event handlers.
+async function syncMissedChanges(handlers) {
+    let since = document.body.dataset.syncVersion;
+    for (;;) {
+        const response = await fetch(`/api/sync?since=${since}`);
+        if (!response.ok) {
+            throw new Error(`Sync failed with status ${response.status}`);
+        }
+        const page = await response.json();
+        page.activities.forEach(activity => handlers['activity.updated'](activity));
+        page.deleted.forEach(id => handlers['activity.deleted']({id: id}));
+        since = page.version;
+        document.body.dataset.syncVersion = since;
+        if (!page.has_more) {
+            return;
+        }
+    }
+}
+
+// Subscribe to server-sent activity events. Handlers receive parsed JSON.
+// Events about another profile's activities are ignored. Changes that
+// cannot be patched in from an event (bulk imports, events missed while
+// offline) are fetched from /api/sync on pages that have a sync version;
+// other pages, and profile changes, fall back to a full reload.
+function subscribeActivityEvents(handlers) {
+    if (!window.EventSource) {
+        return null;
+    }
+
+    const source = new EventSource('/api/events');
+    const reload = () => window.location.reload();
+    let connectedOnce = false;
+    let syncing = Promise.resolve();
+    const catchUp = () => {
+        if (document.body.dataset.syncVersion === undefined) {
+            reload();
+            return;
+        }
+        syncing = syncing.then(() => syncMissedChanges(handlers)).catch(reload);
+    };
+
+    source.addEventListener('open', () => {
+        // Reconnecting means events may have been missed while offline
+        if (connectedOnce) {
+            catchUp();
+        }
+        connectedOnce = true;
+    });
+
+    const profileId = currentProfileId();
+    for (const [name, handler] of Object.entries(handlers)) {
+        source.addEventListener(name, (event) => {
+            const data = JSON.parse(event.data);
+            if (profileId !== null && data.profile_id != null && data.profile_id !== profileId) {
+                return;
+            }
+            handler(data);
+        });
+    }
+    for (const name of ['activities.imported', 'resync']) {
+        source.addEventListener(name, catchUp);
+    }
+    source.addEventListener('profile.changed', reload);
+
+    return source;
+}
+
+// Seconds to wait before each retry of an idempotent POST
+const POST_RETRY_DELAYS = [1, 2, 4];
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    // randomUUID needs a secure context (HTTPS or localhost)
+    return `${Date.now().toString(16)}-${Math.random().toString(16).slice(2)}-${Math.random().toString(16).slice(2)}`;
+}
+
+// POST JSON with an Idempotency-Key, retrying network errors and 5xx
+// responses with the same key. Resolves to the last response.
+async function postIdempotent(url, body) {
+    const options = {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json', 'Idempotency-Key': newIdempotencyKey()},
+        body: JSON.stringify(body)
+    };
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const response = await fetch(url, options);
+            if (response.status < 500 || attempt === POST_RETRY_DELAYS.length) {
+                return response;
+            }
+        } catch (error) {
+            if (attempt === POST_RETRY_DELAYS.length) {
+                throw error;
+            }
+        }
+        await new Promise(resolve => setTimeout(resolve, POST_RETRY_DELAYS[attempt] * 1000));
+    }
+}
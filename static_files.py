@@ -0,0 +1,48 @@
+import hashlib
+import os
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+from starlette.staticfiles import StaticFiles
+
+from images import is_variant_file
+
+STATIC_DIR = "static"
+STATIC_URL = "/static"
+
+# Cache-Control for URLs whose content can never change
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@lru_cache(maxsize=256)
+def _fingerprint(full_path: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(full_path, "rb") as file:
+        digest.update(file.read())
+    return digest.hexdigest()[:12]
+
+
+def static_url(path: str) -> str:
+    """URL of a static file with a content fingerprint in its query string.
+
+    The fingerprint changes whenever the file does, so fingerprinted URLs
+    can be cached forever.
+    """
+    path = path.lstrip("/")
+    full_path = os.path.join(STATIC_DIR, path)
+    try:
+        stat_result = os.stat(full_path)
+    except OSError:
+        return f"{STATIC_URL}/{path}"
+    return f"{STATIC_URL}/{path}?v={_fingerprint(full_path, stat_result.st_mtime_ns, stat_result.st_size)}"
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that lets browsers cache fingerprinted and content-hashed files forever."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        fingerprinted = "v" in parse_qs(scope.get("query_string", b"").decode())
+        if fingerprinted or is_variant_file(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
@@ -0,0 +1,66 @@
+"""Fixtures running the application against a temporary SQLite database.
+
+    pip install -r benchmarks/requirements.txt
+    pytest tests
+"""
+import asyncio
+import os
+import tempfile
+from dataclasses import dataclass
+
+import pytest
+
+# config reads DATABASE_URL when first imported, which may be while the
+# test modules are collected
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db"
+
+
+@dataclass
+class TestClient:
+    """An httpx client on the ASGI app, with its own profile selected, plus the event loop that drives it."""
+    __test__ = False
+
+    loop: asyncio.AbstractEventLoop
+    client: object
+    profile_id: int
+
+    def request(self, method: str, url: str, **kwargs):
+        return self.loop.run_until_complete(self.client.request(method, url, **kwargs))
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+
+@pytest.fixture(scope="session")
+def app_loop():
+    """The event loop the application runs on, with the database migrated."""
+    from database import engine, init_db
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(init_db())
+    yield loop
+
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+
+
+@pytest.fixture
+def client(app_loop):
+    """A client of the application with a new, empty profile selected."""
+    httpx = pytest.importorskip("httpx")
+    from main import app
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+    response = app_loop.run_until_complete(
+        client.post("/api/profiles/", data={"name": "Test", "birthday": "2024-01-01"})
+    )
+    assert response.status_code == 201, response.text
+    yield TestClient(app_loop, client, response.json()["id"])
+
+    app_loop.run_until_complete(client.aclose())
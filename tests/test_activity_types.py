@@ -0,0 +1,38 @@
+def test_rejects_unknown_activity_type(client):
+    response = client.post("/api/activities/", json={
+        "activity_type": 'sleep" onmouseover="alert(1)', "start_time": "2024-03-01T08:00:00Z"
+    })
+
+    assert response.status_code == 422
+
+
+def test_accepts_play(client):
+    response = client.post("/api/activities/", json={
+        "activity_type": "play", "start_time": "2024-03-01T08:00:00Z"
+    })
+
+    assert response.status_code == 201, response.text
+    assert response.json()["activity_type"] == "play"
+
+
+def test_rejects_unknown_activity_type_on_update(client):
+    response = client.post("/api/activities/", json={
+        "activity_type": "sleep", "start_time": "2024-03-01T08:00:00Z"
+    })
+    assert response.status_code == 201, response.text
+
+    response = client.put(f"/api/activities/{response.json()['id']}", json={"activity_type": "<b>nap</b>"})
+
+    assert response.status_code == 422
+
+
+def test_bulk_import_reports_unknown_activity_type(client):
+    response = client.post("/api/activities/bulk", json=[
+        {"activity_type": "sleep", "start_time": "2024-03-01T08:00:00Z"},
+        {"activity_type": "<img src=x>", "start_time": "2024-03-01T09:00:00Z"},
+    ])
+
+    assert response.status_code == 201, response.text
+    result = response.json()
+    assert result["created"] == 1
+    assert [error["index"] for error in result["errors"]] == [1]
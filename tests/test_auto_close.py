@@ -0,0 +1,14 @@
+def test_moving_auto_closed_activity_after_last_neighbour_reopens_it(client):
+    ids = []
+    for start_time in ("2024-03-01T08:00:00Z", "2024-03-01T10:00:00Z"):
+        response = client.post("/api/activities/", json={"activity_type": "sleep", "start_time": start_time})
+        assert response.status_code == 201, response.text
+        ids.append(response.json()["id"])
+    assert client.get(f"/api/activities/{ids[0]}").json()["auto_closed"] is True
+
+    response = client.put(f"/api/activities/{ids[0]}", json={"start_time": "2024-03-01T12:00:00Z"})
+
+    assert response.status_code == 200, response.text
+    moved = response.json()
+    assert moved["end_time"] is None
+    assert moved["auto_closed"] is False
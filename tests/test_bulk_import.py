@@ -0,0 +1,24 @@
+def test_counts_activities_closed_within_the_batch(client):
+    response = client.post("/api/activities/bulk", json=[
+        {"activity_type": "feeding", "start_time": "2024-03-01T08:00:00Z"},
+        {"activity_type": "feeding", "start_time": "2024-03-01T11:00:00Z"},
+        {"activity_type": "feeding", "start_time": "2024-03-01T14:00:00Z"},
+    ])
+
+    assert response.status_code == 201, response.text
+    assert response.json() == {"created": 3, "closed": 2, "errors": []}
+
+
+def test_counts_existing_and_new_activities_closed(client):
+    response = client.post("/api/activities/", json={
+        "activity_type": "feeding", "start_time": "2024-03-01T08:00:00Z"
+    })
+    assert response.status_code == 201, response.text
+
+    response = client.post("/api/activities/bulk", json=[
+        {"activity_type": "feeding", "start_time": "2024-03-01T11:00:00Z"},
+        {"activity_type": "feeding", "start_time": "2024-03-01T14:00:00Z"},
+    ])
+
+    assert response.status_code == 201, response.text
+    assert response.json()["closed"] == 2
@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import create_engine, inspect
+
+# The schema of the first release, before any migration ran (user_version 0)
+BASELINE_SCHEMA = (
+    "CREATE TABLE baby_profiles ("
+    "id INTEGER NOT NULL PRIMARY KEY, name VARCHAR NOT NULL, birthday DATE NOT NULL, "
+    "photo_path VARCHAR, created_at DATETIME NOT NULL)",
+    "CREATE INDEX ix_baby_profiles_id ON baby_profiles (id)",
+    "CREATE TABLE activities ("
+    "id INTEGER NOT NULL PRIMARY KEY, activity_type VARCHAR NOT NULL, start_time DATETIME NOT NULL, "
+    "end_time DATETIME, notes TEXT, role VARCHAR, "
+    "profile_id INTEGER REFERENCES baby_profiles (id) ON DELETE CASCADE, created_at DATETIME NOT NULL)",
+    "CREATE INDEX ix_activities_id ON activities (id)",
+)
+
+
+def test_upgrades_database_with_baseline_schema(tmp_path):
+    pytest.importorskip("alembic")
+    from alembic.script import ScriptDirectory
+    from migrations import alembic_config, upgrade
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(
+            "INSERT INTO baby_profiles (id, name, birthday, created_at) "
+            "VALUES (1, 'Baby', '2024-01-01', '2024-01-01 00:00:00.000000')"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO activities (activity_type, start_time, end_time, profile_id, created_at) VALUES "
+            "('sleep', '2024-03-01 08:00:00.000000', '2024-03-01 09:30:00.000000', 1, '2024-03-01 09:30:00.000000'), "
+            "('feeding', '2024-03-01 10:00:00.000000', NULL, NULL, '2024-03-01 10:00:00.000000')"
+        )
+
+    with engine.begin() as connection:
+        upgrade(connection)
+
+    with engine.connect() as connection:
+        head = ScriptDirectory.from_config(alembic_config()).get_current_head()
+        assert connection.exec_driver_sql("SELECT version_num FROM alembic_version").scalar() == head
+        assert inspect(connection).has_table("activities_archive")
+        assert connection.exec_driver_sql(
+            "SELECT profile_id, activity_type, count, completed_count, total_duration_seconds "
+            "FROM daily_activity_stats ORDER BY activity_type"
+        ).all() == [(1, "feeding", 1, 0, 0), (1, "sleep", 1, 1, 5400)]
+        assert connection.exec_driver_sql(
+            "SELECT duration_seconds FROM activities ORDER BY id"
+        ).scalars().all() == [5400, None]
+    engine.dispose()
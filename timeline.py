@@ -0,0 +1,79 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime, time
+from typing import Optional
+
+from models import LOCAL_TIMEZONE
+from activity_rows import ActivityRow, select_activity_rows
+from archive import tiered_queries
+
+# Number of days shown per timeline page
+DEFAULT_TIMELINE_DAYS = 7
+
+# Rows fetched per round trip while streaming; without yield_per every
+# matching row would be loaded before the first one is returned
+TIMELINE_FETCH_SIZE = 200
+
+# Activity types always shown in the per-day summary
+TIMELINE_COUNT_TYPES = ("sleep", "feeding", "diaper", "play")
+
+
+async def get_timeline_page(
+    db: AsyncSession,
+    profile_id: Optional[int],
+    before: Optional[date] = None,
+    days: int = DEFAULT_TIMELINE_DAYS
+) -> dict:
+    """Group a profile's latest activities into per-day buckets, newest day first.
+
+    Days are local calendar days (TRACKER_TIMEZONE), read from the stored
+    local_day column. Activities are streamed in start_time order as plain
+    column rows and bucketed in a single pass; archived days are read only
+    when the page reaches them (see archive.py).
+    Reading stops as soon as an activity from day ``days + 1`` shows up, so the
+    cost depends on the page size rather than the whole history. Pass the
+    returned ``next_before`` as ``before`` to fetch the next (older) page.
+
+    The page is returned as dicts shaped like TimelinePage, with ActivityRow
+    activities, ready for templates and ORJSONResponse.
+    """
+    def page_rows(model):
+        query = select_activity_rows(model).where(model.for_profile(profile_id))
+        if before:
+            # Local midnight starting that day, so the index on start_time is used
+            query = query.where(
+                model.start_time < datetime.combine(before, time.min, tzinfo=LOCAL_TIMEZONE)
+            )
+        return query
+
+    buckets = []
+    next_before = None
+    for query in await tiered_queries(db, profile_id, page_rows):
+        result = await db.stream(query.execution_options(yield_per=TIMELINE_FETCH_SIZE))
+        keys = tuple(result.keys())
+        try:
+            async for row in result:
+                activity = ActivityRow(zip(keys, row))
+                activity_date = activity["local_day"]
+                if not buckets or buckets[-1][0] != activity_date:
+                    if len(buckets) == days:
+                        # More history exists beyond this page
+                        next_before = buckets[-1][0]
+                        break
+                    buckets.append((activity_date, []))
+                buckets[-1][1].append(activity)
+        finally:
+            await result.close()
+        if next_before is not None:
+            break
+
+    timeline_days = []
+    for activity_date, day_activities in buckets:
+        counts = dict.fromkeys(TIMELINE_COUNT_TYPES, 0)
+        for activity in day_activities:
+            activity_type = activity["activity_type"]
+            counts[activity_type] = counts.get(activity_type, 0) + 1
+        timeline_days.append(
+            {"date": activity_date, "counts": counts, "activities": day_activities}
+        )
+
+    return {"days": timeline_days, "next_before": next_before}
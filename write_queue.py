@@ -0,0 +1,168 @@
+"""Group commit of activity creates and updates.
+
+With WRITE_QUEUE enabled, the create and update routes hand the body of
+their transaction to write_queue instead of committing it themselves. One
+worker takes whatever writes are waiting, plus those arriving within
+WRITE_QUEUE_WINDOW_MS (up to WRITE_QUEUE_MAX_BATCH), runs them in arrival
+order in one transaction, each in its own savepoint, and commits once. A
+burst of quick-adds then costs one write lock acquisition and one fsync
+instead of one per request. A write that fails rolls back only its
+savepoint: its request gets the exception and the rest of the batch still
+commits. Each request's future is resolved after the commit, so a route
+never reports a write that is not durable.
+
+Writes run one at a time, each seeing the ones before it, so auto-close
+sees exactly what it would if every write had been committed on its own.
+
+Like the other in-process singletons, the queue assumes a single
+application process; writes from other processes are simply not batched
+with these.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import async_session
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Transaction body of a write: runs against the given session, does not commit
+WriteOperation = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class WriteQueue:
+    """Batches writes into shared transactions, one batch at a time."""
+
+    def __init__(self, window_seconds: float, max_batch: int):
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None
+
+    def start(self):
+        """Start the worker on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Commit the writes already queued, then stop the worker."""
+        if self._worker is None:
+            return
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+
+    async def submit(self, operation: WriteOperation) -> Any:
+        """Queue a write and wait until its batch has committed.
+
+        Returns what operation returned, or raises what it raised.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.window_seconds
+            while len(batch) < self.max_batch:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                await self._commit_batch(batch)
+            except Exception:
+                logger.exception("Write batch failed")
+
+    async def _commit_batch(self, batch: list):
+        started = time.perf_counter()
+        outcomes = []
+        async with async_session() as db:
+            try:
+                if db.get_bind().dialect.name == "sqlite":
+                    # pysqlite only opens a transaction at the first DML
+                    # statement, so a SAVEPOINT issued before that would start
+                    # (and its RELEASE commit) a transaction of its own.
+                    # IMMEDIATE also takes the write lock up front.
+                    await db.execute(text("BEGIN IMMEDIATE"))
+                for operation, future, queued_at in batch:
+                    if future.cancelled():
+                        continue
+                    try:
+                        async with db.begin_nested():
+                            outcomes.append((future, await operation(db), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+                    # Detach what the write loaded, so its result keeps the
+                    # state it committed with and the next write reloads rows
+                    # instead of sharing (and changing) the same instances
+                    db.expunge_all()
+                commit_started = time.perf_counter()
+                await db.commit()
+                commit_seconds = time.perf_counter() - commit_started
+            except Exception as e:
+                # Nothing in the batch was committed
+                for operation, future, queued_at in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                raise
+
+        metrics.observe_write_batch(
+            len(outcomes),
+            sum(started - queued_at for _, _, queued_at in batch),
+            time.perf_counter() - started,
+            commit_seconds,
+        )
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+write_queue = WriteQueue(settings.write_queue_window_ms / 1000, settings.write_queue_max_batch)
+
+
+async def run_write(db: AsyncSession, operation: WriteOperation) -> Any:
+    """Run a write and commit it: through the write queue when it runs, else on db."""
+    if write_queue.running:
+        # End the request's read transaction first: a burst of queued
+        # requests each holding a pooled connection would leave none for
+        # the worker
+        await db.commit()
+        return await write_queue.submit(operation)
+    try:
+        result = await operation(db)
+    except Exception:
+        await db.rollback()
+        raise
+    await db.commit()
+    return result